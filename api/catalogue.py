@@ -0,0 +1,235 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from urllib.parse import quote
+
+import numpy as np
+import shapely
+from shapely.geometry.polygon import orient
+
+from api.retry import get_retrier
+from api.transport import CATALOGUE_URL, get_http_session
+
+SRID = "4326"
+TIME_FORMAT = "T00:00:00.000Z"
+TIME_END_FORMAT = "T12:00:00.000Z"
+WINDOW_DAYS = 30
+# Соседние окна перекрываются, чтобы не потерять продукт, снятый ровно на границе окна
+WINDOW_OVERLAP = timedelta(seconds=1)
+PAGE_SIZE = 1000
+SEARCH_WORKERS = 4
+REQUEST_TIMEOUT = 60
+FOOTPRINT_VERTICES = 120
+FOOTPRINT_LENGTH = 4000
+MAX_FOOTPRINTS = 8
+
+_DONE = object()
+
+
+def _simplify_part(part, max_vertices, max_length):
+    # Внутренние кольца не сужают выборку, поэтому берётся только внешний контур
+    part = orient(shapely.Polygon(part.exterior), sign=1.0)
+    xmin, ymin, xmax, ymax = part.bounds
+    tolerance = max(xmax - xmin, ymax - ymin) * 1e-4
+    simplified = part
+    while True:
+        footprint = shapely.to_wkt(simplified, rounding_precision=6)
+        if shapely.get_num_coordinates(simplified) <= max_vertices and len(quote(footprint)) <= max_length:
+            return footprint
+        # Буфер на величину допуска гарантирует, что упрощённый контур покрывает исходный
+        simplified = orient(part.buffer(tolerance, join_style="mitre").simplify(tolerance), sign=1.0)
+        tolerance *= 2
+
+
+def build_footprints(geometry, max_vertices=FOOTPRINT_VERTICES, max_length=FOOTPRINT_LENGTH, max_parts=MAX_FOOTPRINTS):
+    """
+    Упрощённые контуры области интересов (WKT) для фильтра Intersects каталога.
+
+    Контур упрощается до max_vertices вершин и max_length символов в URL-кодировке так, чтобы
+    покрывать исходную геометрию. Каждая часть составной области становится отдельным контуром
+    (отдельным запросом); если частей больше max_parts, соседние части объединяются
+    в выпуклые оболочки.
+    """
+    geometry = shapely.make_valid(geometry)
+    parts = [part for part in shapely.get_parts(geometry) if shapely.get_dimensions(part) == 2]
+    if not parts:
+        # Для точек и линий в каталог передаётся охватывающий прямоугольник
+        parts = [shapely.box(*geometry.bounds).buffer(1e-6)]
+
+    if len(parts) > max_parts:
+        order = np.argsort([part.centroid.x for part in parts])
+        groups = np.array_split(order, max_parts)
+        parts = [shapely.union_all([parts[index] for index in group]).convex_hull for group in groups]
+
+    return [_simplify_part(part, max_vertices, max_length) for part in parts]
+
+
+def query_footprints(qp):
+    """Контуры запроса: qp['footprint'] может быть строкой WKT или списком строк."""
+    footprint = qp["footprint"]
+    return [footprint] if isinstance(footprint, str) else list(footprint)
+
+
+def query_interval(qp):
+    """Интервал запроса: qp['time_start'] и qp['time_end'], если заданы, иначе границы дат."""
+    start = qp.get("time_start") or f"{qp['date_start']}{TIME_FORMAT}"
+    end = qp.get("time_end") or f"{qp['date_end']}{TIME_END_FORMAT}"
+    return start, end
+
+
+def generate_filter_query(qp, start=None, end=None, footprint=None):
+    """
+    Генерация строки фильтра для запроса к хранилищу данных.
+
+    Если задан qp['published_after'], выбираются только продукты, опубликованные позже этого момента.
+    """
+    query_start, query_end = query_interval(qp)
+    start = start or query_start
+    end = end or query_end
+    footprint = footprint or query_footprints(qp)[0]
+    filter_query = (
+        f"Collection/Name eq '{qp['setillite']}' "
+        f"and Attributes/OData.CSC.StringAttribute/any(att:att/Name eq 'productType' "
+        f"and att/OData.CSC.StringAttribute/Value eq '{qp['producttype']}') "
+        f"and Attributes/OData.CSC.DoubleAttribute/any(att:att/Name eq 'cloudCover' "
+        f"and att/OData.CSC.DoubleAttribute/Value lt {qp['cloud_percentage']}) "
+        f"and OData.CSC.Intersects(area=geography'SRID={SRID};{footprint}') "
+        f"and ContentDate/Start gt {start} "
+        f"and ContentDate/Start lt {end}"
+    )
+    if qp.get("published_after"):
+        filter_query += f" and PublicationDate gt {qp['published_after']}"
+    return filter_query
+
+
+def format_time(moment):
+    return moment.strftime("%Y-%m-%dT%H:%M:%S.") + f"{moment.microsecond // 1000:03d}Z"
+
+
+def parse_time(value):
+    return datetime.strptime(value[:19], "%Y-%m-%dT%H:%M:%S")
+
+
+def utc_now():
+    """Текущее время UTC без часового пояса, как у parse_time."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def split_date_range(qp, window_days=WINDOW_DAYS):
+    """Разбиение интервала дат запроса на окна не длиннее window_days суток."""
+    start, end = (parse_time(value) for value in query_interval(qp))
+    windows = []
+    while start < end:
+        stop = min(start + timedelta(days=window_days), end)
+        windows.append((format_time(start), format_time(min(stop + WINDOW_OVERLAP, end))))
+        start = stop
+    return windows
+
+
+def fetch_pages(
+    session,
+    filter_query,
+    proxies=None,
+    page_size=PAGE_SIZE,
+    timeout=REQUEST_TIMEOUT,
+    expand_attributes=False,
+    proxy_pool=None,
+):
+    """
+    Постраничная выборка продуктов каталога по ссылкам @odata.nextLink.
+
+    Если передан proxy_pool (ProxyPool), каждая страница запрашивается через пул, иначе через proxies.
+    Временные ошибки и ограничение скорости обрабатывает общий Retrier каталога.
+    """
+    retrier = get_retrier("catalogue")
+    url = CATALOGUE_URL
+    params = {"$filter": filter_query, "$top": page_size}
+    if expand_attributes:
+        params["$expand"] = "Attributes"
+    while url:
+
+        def get_page(page_proxies, url=url, params=params):
+            response = session.get(url, params=params, timeout=timeout, allow_redirects=False, proxies=page_proxies)
+            response.raise_for_status()
+            return response.json()
+
+        if proxy_pool is None:
+            page = retrier.call(get_page, proxies)
+        else:
+            page = retrier.call(proxy_pool.request, get_page)
+        yield page.get("value", [])
+        url = page.get("@odata.nextLink")
+        # Ссылка на следующую страницу уже содержит все параметры запроса
+        params = None
+
+
+def iter_products(
+    qp,
+    proxies=None,
+    window_days=WINDOW_DAYS,
+    page_size=PAGE_SIZE,
+    max_workers=SEARCH_WORKERS,
+    timeout=REQUEST_TIMEOUT,
+    expand_attributes=False,
+    proxy_pool=None,
+):
+    """
+    Потоковый поиск продуктов в каталоге CDSE.
+
+    Интервал дат делится на окна, каждое окно запрашивается для каждого контура области
+    интересов; запросы выполняются параллельно в max_workers потоков, каждый читается
+    постранично до конца через proxies или пул proxy_pool. Продукты отдаются по мере
+    получения страниц без повторов, поэтому потребитель может начать работу до окончания поиска.
+    """
+    session = get_http_session()
+    windows = [
+        (start, end, footprint)
+        for footprint in query_footprints(qp)
+        for start, end in split_date_range(qp, window_days)
+    ]
+    pages = queue.Queue(maxsize=2 * max_workers)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def search_window(start, end, footprint):
+        try:
+            filter_query = generate_filter_query(qp, start, end, footprint)
+            pages_iter = fetch_pages(session, filter_query, proxies, page_size, timeout, expand_attributes, proxy_pool)
+            for products in pages_iter:
+                if stop.is_set():
+                    return
+                put(products)
+        except Exception as e:
+            put(e)
+        finally:
+            put(_DONE)
+
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="odata-search")
+    for window in windows:
+        executor.submit(search_window, *window)
+
+    seen = set()
+    remaining = len(windows)
+    try:
+        while remaining:
+            item = pages.get()
+            if item is _DONE:
+                remaining -= 1
+            elif isinstance(item, Exception):
+                raise item
+            else:
+                for product in item:
+                    if product["Id"] not in seen:
+                        seen.add(product["Id"])
+                        yield product
+    finally:
+        stop.set()
+        executor.shutdown(wait=False, cancel_futures=True)
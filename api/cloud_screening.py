@@ -0,0 +1,107 @@
+import importlib.util
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import shapely
+
+from api.transfer import download_object
+from api.transport import BUCKET
+
+# Классы SCL: тень от облаков, облака средней и высокой вероятности, перистые облака
+SCL_CLOUD_CLASSES = (3, 8, 9, 10)
+CLOUD_PROBABILITY_THRESHOLD = 50
+SCREENING_DIRECTORY = ".cloud_screening"
+
+
+def find_cloud_raster(objects):
+    """Ключ наименьшего растра облачности продукта L2A: SCL 60/20 м или маска вероятности облаков."""
+    candidates = {}
+    for obj in objects:
+        name = os.path.basename(obj["Key"])
+        if name.endswith("_SCL_60m.jp2"):
+            candidates[0] = (obj, "scl")
+        elif name.endswith("_SCL_20m.jp2"):
+            candidates[1] = (obj, "scl")
+        elif name in ("MSK_CLDPRB_60m.jp2", "MSK_CLDPRB_20m.jp2"):
+            candidates[2 if name.endswith("60m.jp2") else 3] = (obj, "probability")
+    return candidates[min(candidates)] if candidates else (None, None)
+
+
+def aoi_cloud_fraction(raster_path, kind, aoi_wkb, aoi_crs_wkt):
+    """
+    Доля облачных пикселей растра raster_path внутри области интересов (0–1).
+
+    Выполняется в отдельном процессе. Читается только окно растра, покрывающее область
+    интересов; пиксели без данных не учитываются. Если над областью нет данных, возвращается None.
+    """
+    import rasterio
+    from pyproj import Transformer
+    from rasterio.errors import WindowError
+    from rasterio.features import geometry_mask, geometry_window
+    from shapely.ops import transform
+
+    with rasterio.open(raster_path) as raster:
+        aoi = shapely.from_wkb(aoi_wkb)
+        transformer = Transformer.from_crs(aoi_crs_wkt, raster.crs.to_wkt(), always_xy=True)
+        aoi = transform(transformer.transform, aoi)
+        try:
+            window = geometry_window(raster, [aoi])
+        except WindowError:
+            return None
+        data = raster.read(1, window=window)
+        inside = geometry_mask([aoi], out_shape=data.shape, transform=raster.window_transform(window), invert=True)
+        nodata = raster.nodata
+
+    # В SCL значение 0 — класс «нет данных», а в маске вероятности 0 означает 0 % облачности,
+    # поэтому для неё исключается только значение nodata из метаданных растра
+    if kind == "scl":
+        nodata = 0
+    valid = inside if nodata is None else inside & (data != nodata)
+    if not valid.any():
+        return None
+    if kind == "scl":
+        cloudy = np.isin(data, SCL_CLOUD_CLASSES)
+    else:
+        cloudy = data >= CLOUD_PROBABILITY_THRESHOLD
+    return float((cloudy & valid).sum() / valid.sum())
+
+
+class CloudScreener:
+    """
+    Предварительная оценка облачности продукта над областью интересов.
+
+    Для каждого продукта загружается только небольшой растр облачности (SCL или маска
+    вероятности облаков), доля облаков внутри области интересов считается в пуле процессов.
+    Полная загрузка выполняется только для продуктов с облачностью не выше threshold процентов.
+    """
+
+    def __init__(self, client, input_shapefile, threshold, target_directory, max_workers=None):
+        if importlib.util.find_spec("rasterio") is None:
+            raise ImportError("Для оценки облачности по области интересов необходим пакет rasterio")
+        self.client = client
+        self.threshold = threshold
+        self.directory = os.path.join(target_directory, SCREENING_DIRECTORY)
+        self.aoi_wkb = shapely.to_wkb(input_shapefile.geometry.unary_union)
+        self.aoi_crs_wkt = input_shapefile.crs.to_wkt()
+        self.executor = ProcessPoolExecutor(max_workers=max_workers)
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def cloud_percentage(self, objects):
+        """Облачность продукта над областью интересов в процентах (100, если данных нет; None — нет растра)."""
+        obj, kind = find_cloud_raster(objects)
+        if obj is None:
+            return None
+        path = os.path.join(self.directory, obj["Key"])
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            download_object(self.client, BUCKET, obj["Key"], obj["Size"], path, etag=obj.get("ETag"))
+        fraction = self.executor.submit(aoi_cloud_fraction, path, kind, self.aoi_wkb, self.aoi_crs_wkt).result()
+        return 100.0 if fraction is None else fraction * 100
+
+    def accept(self, objects):
+        """Пропустить ли продукт к полной загрузке; возвращает (решение, облачность в процентах)."""
+        percentage = self.cloud_percentage(objects)
+        return percentage is None or percentage <= self.threshold, percentage
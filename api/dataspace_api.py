@@ -1,50 +1,92 @@
 import errno
+import functools
+import heapq
 import os
-import shutil
-import sys
-
-import boto3
-import requests
-from fp.fp import FreeProxy
-
-from gui.gui_utils import DownloadBarFrame, DownloadProgressBar, InformationTable
-
-SRID = "4326"
-TIME_FORMAT = "T00:00:00.000Z"
-TIME_END_FORMAT = "T12:00:00.000Z"
-ENDPOINT_URL = "https://eodata.dataspace.copernicus.eu/"
-BUCKET = "eodata"
+import queue
+import threading
+
+import numpy as np
+import shapely
+
+from api.catalogue import iter_products
+from api.cloud_screening import CloudScreener
+from api.instrumentation import RunStats, log_stages
+from api.integrity import ProductVerifier
+from api.local_index import ProductIndex
+from api.planning import SpaceReservation, check_free_space, plan_downloads
+from api.products import select_best_products
+from api.proxy_pool import get_proxy_pool
+from api.query_cache import QueryCache
+from api.reporting import CLOUDY, DOWNLOADED, DOWNLOADING, FAILED, PRESENT, Reporter
+from api.retry import metrics as retry_metrics
+from api.selection import ObjectSelection
+from api.telemetry import TransferMonitor
+from api.transfer import CHUNK_CONCURRENCY, CHUNK_SIZE, TokenBucket, download_object
+from api.transport import BUCKET, get_s3_client, list_objects
+
+MAX_WORKERS = 8
+LIST_WORKERS = 4
+PRODUCT_QUEUE_SIZE = 8
+OBJECT_QUEUE_FACTOR = 4
+# Сколько раз повторно загружаются объекты с несовпавшей контрольной суммой
+REFETCH_ATTEMPTS = 2
+
+
+def _measure(geometries, dimension):
+    """Мера покрытия: площадь для полигонов, длина для линий, число вершин для точек."""
+    if dimension == 2:
+        return shapely.area(geometries)
+    if dimension == 1:
+        return shapely.length(geometries)
+    return shapely.get_num_coordinates(geometries).astype(float)
+
+
+def greedy_cover(pieces, dimension=2):
+    """
+    Ленивый жадный выбор частей pieces, покрывающих их объединение.
+
+    На каждом шаге берётся часть с наибольшим ещё не покрытым вкладом. Вклад части может
+    только уменьшаться, поэтому он пересчитывается лишь для вершины кучи и только относительно
+    уже выбранных частей, пересекающих её охват, а не всей покрытой области.
+    """
+    pieces = np.asarray(pieces)
+    gains = _measure(pieces, dimension)
+    tolerance = gains.sum() * 1e-9
+    bounds = shapely.bounds(pieces)
+    heap = [(-gain, index) for index, gain in enumerate(gains) if gain > tolerance]
+    heapq.heapify(heap)
+
+    selected = []
+    while heap:
+        _, index = heapq.heappop(heap)
+        if selected:
+            chosen = np.array(selected)
+            box_min, box_max = bounds[index, :2], bounds[index, 2:]
+            overlap = np.all(bounds[chosen, :2] <= box_max, axis=1) & np.all(bounds[chosen, 2:] >= box_min, axis=1)
+            neighbours = pieces[chosen[overlap]]
+            if len(neighbours):
+                uncovered = shapely.difference(pieces[index], shapely.union_all(neighbours))
+                gains[index] = _measure(uncovered, dimension)
+        if gains[index] <= tolerance:
+            continue
+        if heap and gains[index] < -heap[0][0]:
+            heapq.heappush(heap, (-gains[index], index))
+            continue
+        selected.append(index)
+    return selected
 
 
 def get_tile_list(satellite_grid, input_shapefile):
+    """Тайлы сетки satellite_grid (SentinelGrid), покрывающие область интересов."""
     if input_shapefile.crs != satellite_grid.crs:
         input_shapefile = input_shapefile.to_crs(satellite_grid.crs)
     # Convert second shapefile to single polygon
     single_polygon = input_shapefile.geometry.unary_union
-    # Loop through polygons in first shapefile and check for intersection with single polygon
-    selected_polygons = []
-    tiles = []
-    for _, row in satellite_grid.iterrows():
-        if row.geometry.intersects(single_polygon):
-            selected_polygons.append(row)
-
-    sorted_list = sorted(selected_polygons, key=lambda x: (single_polygon.difference(x.geometry)).area, reverse=False)
-
-    for tile_grid in sorted_list:
-        if tile_grid.geometry.intersects(single_polygon):
-            single_polygon = single_polygon.difference(tile_grid.geometry)
-            tiles.append(tile_grid["Name"])
-
-    return tiles
+    candidates = satellite_grid.query(single_polygon)
+    pieces = shapely.intersection(satellite_grid.geometries(candidates), single_polygon)
+    dimension = shapely.get_dimensions(single_polygon)
 
-
-def get_folder_size(folder_path):
-    total_size = 0
-    for path, _, files in os.walk(folder_path):
-        for file in files:
-            file_path = os.path.join(path, file)
-            total_size += os.path.getsize(file_path)
-    return total_size
+    return [str(satellite_grid.names[candidates[index]]) for index in greedy_cover(pieces, dimension)]
 
 
 def make_path(path):
@@ -55,130 +97,549 @@ def make_path(path):
             raise
 
 
-def generate_filter_query(qp):
-    """Генерация строки фильтра для запроса к хранилищу данных."""
-    filter_query = (
-        f"Collection/Name eq '{qp['setillite']}' "
-        f"and Attributes/OData.CSC.StringAttribute/any(att:att/Name eq 'productType' "
-        f"and att/OData.CSC.StringAttribute/Value eq '{qp['producttype']}') "
-        f"and Attributes/OData.CSC.DoubleAttribute/any(att:att/Name eq 'cloudCover' "
-        f"and att/OData.CSC.DoubleAttribute/Value lt {qp['cloud_percentage']}) "
-        f"and OData.CSC.Intersects(area=geography'SRID={SRID};{qp['footprint']}') "
-        f"and ContentDate/Start gt {qp['date_start']}{TIME_FORMAT} "
-        f"and ContentDate/Start lt {qp['date_end']}{TIME_END_FORMAT}"
-    )
-    return filter_query
-
-
-def get_s3path(qp, satellite_grid, input_shapefile):
-    try:
-        filter_query = generate_filter_query(qp)
-        all_proxies = FreeProxy(timeout=1, rand=True).get_proxy_list(repeat=False)
-
-        for proxy in all_proxies:
-            proxies = {"http": proxy, "https": proxy}
-            url = f"https://catalogue.dataspace.copernicus.eu/odata/v1/Products?$filter={filter_query}"
-
-            try:
-                result = requests.get(url, timeout=60, allow_redirects=False, proxies=proxies).json()
-                zones = get_tile_list(satellite_grid, input_shapefile)
-                print("Зоны, покрывающие область интересов:", ", ".join(map(str, zones)))
-                if result.get("value"):
-                    products_s3path = [
-                        product["S3Path"]
-                        for product in result["value"]
-                        if any(zone == product["Name"][39:44] for zone in zones)
-                    ]
-                    if products_s3path:
-                        return products_s3path
-                    else:
-                        print("Продукты не найдены в каталоге CDSE")
-                        sys.exit()
-                else:
-                    print("В каталоге CDSE не найдено продуктов с указанными параметрами")
-                    sys.exit()
-
-            except requests.RequestException as e:
-                continue
-    except Exception as e:
-        print(f"Произошла ошибка: {e}")
-        sys.exit()
-
-
-def download_file(resource, bucket, obj, target_directory):
-    target = os.path.join(target_directory, obj.key)
+def search_catalogue(qp, expand_attributes=False, stats=None):
+    """
+    Потоковый поиск в каталоге; каждая страница запрашивается через общий ProxyPool.
+
+    В stats (RunStats) время пополнения пула прокси учитывается в стадии proxy_discovery,
+    а время запросов к каталогу — в стадии catalogue.
+    """
+    stats = stats or RunStats()
+    proxy_pool = get_proxy_pool()
+    with stats.stage("proxy_discovery"):
+        proxy_pool.refresh()
+    products = iter_products(qp, proxy_pool=proxy_pool, expand_attributes=expand_attributes)
+    yield from stats.timed("catalogue", products)
+
+
+def iter_catalogue_products(qp, zones, expand_attributes=False, query_cache=None, stats=None):
+    """
+    Потоковая выдача продуктов каталога на тайлах zones.
+
+    Если передан query_cache (QueryCache), с сервера запрашиваются только части интервала дат,
+    которых нет в кэше; список прокси при этом загружается, только если запрос к серверу нужен.
+    Всё время поиска, включая кэш, учитывается в стадии search статистики stats.
+    """
+    stats = stats or RunStats()
+    search = functools.partial(search_catalogue, expand_attributes=expand_attributes, stats=stats)
+    if query_cache is None:
+        products = search(qp)
+    else:
+        products = query_cache.iter_products(qp, search, expand_attributes)
+
+    seen = set()
+    for product in stats.timed("search", products):
+        if product["Name"][39:44] in zones and product["S3Path"] not in seen:
+            seen.add(product["S3Path"])
+            yield product
+
+
+def iter_selected_products(qp, zones, product_policy=None, query_cache=None, stats=None):
+    """
+    Потоковая выдача продуктов каталога на тайлах zones.
+
+    Если задано правило product_policy (см. select_best_products), для каждого тайла и даты
+    остаётся один продукт; выбор делается по всему результату поиска, поэтому продукты
+    выдаются после его завершения.
+    """
+    products = iter_catalogue_products(qp, zones, product_policy == "cloud", query_cache, stats)
+    if product_policy is not None:
+        found = list(products)
+        products = select_best_products(found, product_policy)
+        if len(products) < len(found):
+            print(f"Исключено повторяющихся продуктов тайлов за одну дату: {len(found) - len(products)}")
+    yield from products
+
+
+def iter_s3path(qp, satellite_grid, input_shapefile, product_policy=None, query_cache=None, stats=None):
+    """Потоковая выдача путей S3 продуктов, покрывающих область интересов."""
+    stats = stats or RunStats()
+    with stats.stage("tile_selection"):
+        zones = set(get_tile_list(satellite_grid, input_shapefile))
+    print("Зоны, покрывающие область интересов:", ", ".join(map(str, zones)))
+
+    for product in iter_selected_products(qp, zones, product_policy, query_cache, stats):
+        yield product["S3Path"]
+
+
+def download_file(
+    client,
+    bucket,
+    obj,
+    target_directory,
+    chunk_size=CHUNK_SIZE,
+    chunk_concurrency=CHUNK_CONCURRENCY,
+    callback=None,
+    bandwidth=None,
+):
+    target = os.path.join(target_directory, obj["Key"])
 
-    if obj.key.endswith("/"):
+    if obj["Key"].endswith("/"):
         make_path(target)
     else:
         dirname = os.path.dirname(target)
         if dirname != "":
             make_path(dirname)
-        resource.Object(bucket, obj.key).download_file(target)
+        progress = {"callback": callback} if callback else {}
+        download_object(
+            client,
+            bucket,
+            obj["Key"],
+            obj["Size"],
+            target,
+            chunk_size,
+            chunk_concurrency,
+            etag=obj.get("ETag"),
+            bandwidth=bandwidth,
+            **progress,
+        )
 
 
-def download_sentinel_images(
-    access_key, secret_key, qp, satellite_grid, input_shapefile, target_directory, master_frame
-):
-    s3_path = get_s3path(qp, satellite_grid, input_shapefile)
+def log_transfer(event, file_name, snapshot):
+    """Запись в журнал итогов загрузки продукта по данным TransferMonitor."""
+    if event == "done":
+        megabytes = snapshot["transferred"] / 1024 / 1024
+        elapsed = max(snapshot["elapsed"], 1e-6)
+        print(f"Продукт {file_name}: {megabytes:.1f} МБ за {elapsed:.0f} с ({megabytes / elapsed:.2f} МБ/с)")
+
+
+def log_retries():
+    """Запись в журнал счётчиков повторов запросов по сервисам, если повторы были."""
+    for name, counters in retry_metrics().items():
+        if counters["retries"] or counters["failures"]:
+            limit = "нет" if counters["limit"] is None else counters["limit"]
+            print(
+                f"Запросы {name}: повторов {counters['retries']}, ограничений скорости {counters['throttled']}, "
+                f"отказов {counters['failures']}, предел параллельности {limit}"
+            )
+
+
+class DownloadPipeline:
+    """
+    Конвейер поиск → список объектов → загрузка → проверка.
+
+    Каждая стадия работает в своих потоках, стадии связаны очередями ограниченного размера:
+    поиск не уходит дальше чем на PRODUCT_QUEUE_SIZE продуктов вперёд, а список объектов
+    продукта не читается, пока загрузчики не разберут очередь объектов. Поэтому загрузка
+    начинается с первого найденного продукта, а в памяти хранится ограниченный объём метаданных.
+    Семафор download_slots, общий для нескольких конвейеров, ограничивает число одновременных
+    загрузок объектов во всех них. Ошибка загрузки продукта не останавливает конвейер: продукт
+    помечается как неудавшийся (FAILED) и попадает в failed, остальные загружаются дальше.
+    Если передан verifier (ProductVerifier), каждый объект хешируется сразу после загрузки,
+    а продукт сверяется с manifest.safe; повреждённые объекты загружаются заново.
+    Время стадий, ожидания в очередях и счётчики продуктов, объектов и байтов собираются
+    в stats (RunStats). Списки объектов, уже полученные при планировании, передаются в
+    listings ({путь S3: список}) и повторно не запрашиваются. Если передан space
+    (SpaceReservation), продукт, не помещающийся на диск, помечается неудавшимся до загрузки.
+    """
+
+    def __init__(
+        self,
+        client,
+        index,
+        target_directory,
+        reporter,
+        selection=None,
+        screener=None,
+        max_workers=MAX_WORKERS,
+        list_workers=LIST_WORKERS,
+        transfer=None,
+        download_slots=None,
+        verifier=None,
+        stats=None,
+        listings=None,
+        space=None,
+    ):
+        self.client = client
+        self.index = index
+        self.target_directory = target_directory
+        self.reporter = reporter
+        self.selection = selection or ObjectSelection()
+        self.screener = screener
+        self.max_workers = max_workers
+        self.list_workers = list_workers
+        self.transfer = transfer or {}
+        self.download_slots = download_slots
+        self.verifier = verifier
+        self.stats = stats or RunStats()
+        self.listings = dict(listings or {})
+        self.space = space
+        self.monitor = TransferMonitor()
+        self.monitor.subscribe(log_transfer)
+
+        self.products = queue.Queue(maxsize=PRODUCT_QUEUE_SIZE)
+        self.objects = queue.Queue(maxsize=max_workers * OBJECT_QUEUE_FACTOR)
+        self.verified = queue.Queue()
+        self.queue_names = {self.products: "products", self.objects: "objects", self.verified: "verified"}
+        self.stop = threading.Event()
+        self.lock = threading.Lock()
+        self.errors = []
+        self.pending = {}
+        self.results = []
+        self.failed = []
+
+    def run(self, s3_paths):
+        """Загрузить продукты из итератора путей S3, вернуть их пути в порядке выдачи итератором."""
+        searchers = [self._start(self._search_stage, s3_paths)]
+        listers = [self._start(self._list_stage) for _ in range(self.list_workers)]
+        downloaders = [self._start(self._download_stage) for _ in range(self.max_workers)]
+        verifiers = [self._start(self._verify_stage)]
+
+        # Стадия закрывается, когда завершились все потоки предыдущей стадии
+        self._close(searchers, self.products, len(listers))
+        self._close(listers, self.objects, len(downloaders))
+        self._close(downloaders, self.verified, len(verifiers))
+        for thread in verifiers:
+            thread.join()
+        self.stats.count("bytes_downloaded", self.monitor.snapshot()["transferred"])
+
+        if self.errors:
+            raise self.errors[0]
+        if self.failed:
+            print(f"Не удалось загрузить продуктов: {len(self.failed)}")
+        return [s3path for _, s3path in sorted(self.results)]
+
+    def _start(self, stage, *args):
+        def target():
+            try:
+                stage(*args)
+            except BaseException as e:
+                with self.lock:
+                    self.errors.append(e)
+                self.stop.set()
+
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        return thread
+
+    def _close(self, threads, next_queue, consumers):
+        for thread in threads:
+            thread.join()
+        for _ in range(consumers):
+            self._put(next_queue, None)
+
+    def _put(self, stage_queue, item):
+        with self.stats.stage(f"queue_put.{self.queue_names[stage_queue]}"):
+            while not self.stop.is_set():
+                try:
+                    stage_queue.put(item, timeout=0.5)
+                    return
+                except queue.Full:
+                    continue
+
+    def _get(self, stage_queue):
+        with self.stats.stage(f"queue_get.{self.queue_names[stage_queue]}"):
+            while not self.stop.is_set():
+                try:
+                    return stage_queue.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+            return None
+
+    def _search_stage(self, s3_paths):
+        found = 0
+        for index, s3path_prod in enumerate(s3_paths):
+            if self.stop.is_set():
+                return
+            self._put(self.products, (index, s3path_prod))
+            found += 1
+            self.stats.count("products_found")
+        if not found:
+            print("В каталоге CDSE не найдено продуктов с указанными параметрами")
+
+    def _list_stage(self):
+        while (item := self._get(self.products)) is not None:
+            index, s3path_prod = item
+            try:
+                self._list_product(index, s3path_prod)
+            except Exception as e:
+                s3path = s3path_prod.removeprefix(f"/{BUCKET}/")
+                self._product_failed(s3path.split("/")[-1], s3path, e)
 
-    data_for_table = [[path.split("/")[-1], "необходимо загрузить"] for path in s3_path]
-    information_table = InformationTable(master=master_frame, data=data_for_table)
-    products_path = []
-    for s3path_prod in s3_path:
+    def _list_product(self, index, s3path_prod):
         s3path = s3path_prod.removeprefix(f"/{BUCKET}/")
         file_name = s3path.split("/")[-1]
-        dirname = os.path.dirname(s3path)
-
-        if not os.path.exists(os.path.join(target_directory, dirname)):
-            make_path(os.path.join(target_directory, dirname))
-        fls = os.listdir(os.path.join(target_directory, dirname))
 
-        resource = boto3.resource(
-            service_name="s3", aws_access_key_id=access_key, aws_secret_access_key=secret_key, endpoint_url=ENDPOINT_URL
-        )
-        s3path = s3path + ""
-        objects = list(resource.Bucket(BUCKET).objects.filter(Prefix=s3path))
-
-        s3_size = sum([obj.size for obj in objects])
-        if not objects:
+        with self.stats.stage("local_check"):
+            complete = self.index.is_complete(s3path, self.selection)
+        if complete:
+            self._product_present(index, s3path, file_name)
+            return
+
+        listing = self.listings.pop(s3path, None)
+        if listing is None:
+            with self.stats.stage("s3_listing"):
+                listing = list_objects(self.client, s3path)
+        if not listing:
             raise Exception("Продукты не найдены в каталоге CDSE")
+        self.stats.count("objects_listed", len(listing))
+
+        if self.screener is not None:
+            with self.stats.stage("cloud_screening"):
+                accepted, percentage = self.screener.accept(listing)
+            if not accepted:
+                print(f"Продукт {file_name} пропущен: облачность над областью интересов {percentage:.0f}%")
+                self.reporter.product_status(file_name, CLOUDY, s3path=s3path, cloud_percentage=percentage)
+                self.stats.count("products_cloudy")
+                return
+        # В индекс записывается полный список объектов, загружаются только выбранные
+        objects = self.selection.filter(listing)
+        s3_size = sum([obj["Size"] for obj in objects])
+
+        with self.stats.stage("local_check"):
+            self.index.register(s3path, listing)
+            # Объекты сверяются с диском по размеру и ETag: загружаются только отсутствующие и неполные
+            self.index.reconcile_product(s3path)
+            present = self.index.is_complete(s3path, self.selection)
+            complete = {obj["Key"] for obj in self.index.product_objects(s3path) if obj["complete"]}
+        if present:
+            self._product_present(index, s3path, file_name)
+            return
+
+        # Каталоги создаются сразу, чтобы файлы продукта можно было загружать в любом порядке
+        files = []
+        for obj in objects:
+            if obj["Key"].endswith("/"):
+                download_file(self.client, BUCKET, obj, self.target_directory)
+            else:
+                files.append(obj)
+        if not files:
+            raise Exception("Ни один объект продукта не соответствует выбранным каналам, разрешениям и маскам")
+        missing = [obj for obj in files if obj["Key"] not in complete]
+        if self.space is not None:
+            self.space.reserve(sum(obj["Size"] for obj in missing))
+
+        print(
+            f"Продукт {file_name} не находится в папке. "
+            f"Необходимо загрузить объектов: {len(missing)} из {len(files)}..."
+        )
+        self.reporter.product_status(file_name, DOWNLOADING, s3path=s3path, size=s3_size, objects=len(missing))
 
-        size_directory = get_folder_size(os.path.join(target_directory, s3path))
-
-        download_location = os.path.join(target_directory, s3path)
-
-        if file_name in fls and s3_size == size_directory:
-            print(f"Файл {file_name} находится в папке")
-            for row_num, row in enumerate(data_for_table):
-                if row[0] == file_name:
-                    # Изменить значение в поле 1 на new_status
-                    information_table.insert(row_num, 1, "в папке")
-                    break
-            products_path.append(s3path)
-
-        else:
-            if os.path.exists(os.path.join(download_location, "GRANULE")):
-                shutil.rmtree(os.path.join(download_location, "GRANULE"))
-
-            print(f"Продукт {file_name} не находится в папке. Необходимо загрузить...")
-            for row_num, row in enumerate(data_for_table):
-                if row[0] == file_name:
-                    # Изменить значение в поле 1 на new_status
-                    information_table.insert(row_num, 1, "загрузка...")
-                    break
-
-            download_barr = DownloadBarFrame(master=master_frame)
-            DownloadProgressBar(download_barr.download_barr_frame, download_location, s3_size)
-
+        self.monitor.start_product(
+            file_name,
+            s3_size,
+            done=sum(obj["Size"] for obj in files if obj["Key"] in complete),
+            objects=[obj["Key"] for obj in missing],
+        )
+        self.reporter.product_progress(file_name, self.monitor)
+
+        with self.lock:
+            self.pending[file_name] = {
+                "index": index,
+                "s3path": s3path,
+                "size": s3_size,
+                "remaining": len(missing),
+                "errors": [],
+                "objects": missing,
+                "hashes": {},
+            }
+        if not missing:
+            self._put(self.verified, file_name)
+        for obj in missing:
+            self._put(self.objects, (file_name, obj))
+
+    def _product_present(self, index, s3path, file_name):
+        print(f"Файл {file_name} находится в папке")
+        self.reporter.product_status(file_name, PRESENT, s3path=s3path)
+        self.stats.count("products_present")
+        with self.lock:
+            self.results.append((index, s3path))
+
+    def _product_failed(self, file_name, s3path, error):
+        print(f"Ошибка загрузки продукта {file_name}: {error}")
+        self.reporter.product_status(file_name, FAILED, s3path=s3path, error=str(error))
+        self.stats.count("products_failed")
+        with self.lock:
+            self.failed.append((s3path, error))
+
+    def _download_stage(self):
+        while (item := self._get(self.objects)) is not None:
+            file_name, obj = item
+            self.monitor.object_state(file_name, obj["Key"], "загрузка")
+            callback = functools.partial(self.monitor.add_bytes, file_name)
+            error = None
+            try:
+                if self.download_slots is not None:
+                    with self.stats.stage("slot_wait"):
+                        self.download_slots.acquire()
+                try:
+                    with self.stats.stage("transfer"):
+                        download_file(
+                            self.client, BUCKET, obj, self.target_directory, callback=callback, **self.transfer
+                        )
+                finally:
+                    if self.download_slots is not None:
+                        self.download_slots.release()
+            except Exception as e:
+                # Повторы уже исчерпаны Retrier: объект остаётся незагруженным, продукт — неполным
+                error = e
+            if self.space is not None:
+                self.space.release(obj["Size"])
+            self.stats.count("objects_failed" if error else "objects_downloaded")
+            self.monitor.object_state(file_name, obj["Key"], "ошибка" if error else "загружен")
+            with self.lock:
+                product = self.pending[file_name]
+            if error is None:
+                self.index.object_done(product["s3path"], obj["Key"], obj.get("ETag"))
+            # Хеширование начинается до учёта объекта, чтобы проверка продукта застала все хеши
+            future = self.verifier.submit(obj) if error is None and self.verifier is not None else None
+            with self.lock:
+                if future is not None:
+                    product["hashes"][obj["Key"]] = future
+                if error is not None:
+                    product["errors"].append(error)
+                product["remaining"] -= 1
+                finished = product["remaining"] == 0
+            if finished:
+                self._put(self.verified, file_name)
+
+    def _check_integrity(self, file_name, product):
+        """Сверить продукт с manifest.safe и загрузить заново повреждённые объекты; вернуть неисправленные."""
+        s3path = product["s3path"]
+        objects = product["objects"]
+        hashes = product["hashes"]
+        for attempt in range(REFETCH_ATTEMPTS + 1):
+            corrupted = self.verifier.corrupted(s3path, objects, hashes)
+            if not corrupted or attempt == REFETCH_ATTEMPTS:
+                break
+            print(f"Продукт {file_name}: не совпали контрольные суммы объектов ({len(corrupted)}), повторная загрузка")
+            self.stats.count("objects_refetched", len(corrupted))
+            self.index.invalidate(s3path, corrupted)
+            objects = [obj for obj in objects if obj["Key"] in corrupted]
+            hashes = {}
             for obj in objects:
-                download_file(resource, BUCKET, obj, target_directory)
+                # Байты повреждённой копии больше не считаются загруженными
+                self.monitor.add_bytes(file_name, -obj["Size"], False)
+                callback = functools.partial(self.monitor.add_bytes, file_name)
+                download_file(self.client, BUCKET, obj, self.target_directory, callback=callback, **self.transfer)
+                self.index.object_done(s3path, obj["Key"], obj.get("ETag"))
+                hashes[obj["Key"]] = self.verifier.submit(obj)
+        if corrupted:
+            self.index.invalidate(s3path, corrupted)
+        return corrupted
+
+    def _verify_stage(self):
+        while (file_name := self._get(self.verified)) is not None:
+            with self.lock:
+                product = self.pending.pop(file_name)
+            self.index.reconcile_product(product["s3path"])
+            if not self.index.is_complete(product["s3path"], self.selection):
+                self.monitor.finish_product(file_name, failed=True)
+                error = product["errors"][0] if product["errors"] else None
+                if error is None:
+                    error = Exception(f"Размер продукта {file_name} не совпадает с размером в хранилище CDSE")
+                self._product_failed(file_name, product["s3path"], error)
+                continue
+            if self.verifier is not None:
+                try:
+                    with self.stats.stage("verify"):
+                        corrupted = self._check_integrity(file_name, product)
+                except Exception as e:
+                    corrupted = e
+                if corrupted:
+                    self.monitor.finish_product(file_name, failed=True)
+                    if not isinstance(corrupted, Exception):
+                        corrupted = Exception(f"Не совпадают контрольные суммы объектов: {', '.join(corrupted)}")
+                    self._product_failed(file_name, product["s3path"], corrupted)
+                    continue
+            self.monitor.finish_product(file_name)
             print(f"Продукт Sentinel-2: {file_name} загружен!")
-            for row_num, row in enumerate(data_for_table):
-                if row[0] == file_name:
-                    # Изменить значение в поле 1 на new_status
-                    information_table.insert(row_num, 1, "загружено!")
-                    break
-            products_path.append(s3path)
-
-    return products_path
+            snapshot = self.monitor.snapshot(file_name)
+            self.reporter.product_status(
+                file_name,
+                DOWNLOADED,
+                s3path=product["s3path"],
+                size=product["size"],
+                transferred=snapshot["transferred"],
+                elapsed=round(snapshot["elapsed"], 3),
+            )
+            self.stats.count("products_downloaded")
+            with self.lock:
+                self.results.append((product["index"], product["s3path"]))
+
+
+def download_sentinel_images(
+    access_key,
+    secret_key,
+    qp,
+    satellite_grid,
+    input_shapefile,
+    target_directory,
+    reporter=None,
+    max_workers=MAX_WORKERS,
+    chunk_size=CHUNK_SIZE,
+    chunk_concurrency=CHUNK_CONCURRENCY,
+    list_workers=LIST_WORKERS,
+    selection=None,
+    aoi_cloud_percentage=None,
+    product_policy=None,
+    use_query_cache=True,
+    download_slots=None,
+    verify=True,
+    stats=None,
+    order=None,
+    check_space=True,
+    bandwidth=None,
+):
+    """
+    Загрузка продуктов Sentinel-2, найденных по запросу qp, конвейером DownloadPipeline.
+
+    Продукты загружаются потоково, с первого найденного. Если задан порядок order
+    (см. api.planning.ORDERS), сначала составляется план загрузки всех продуктов. check_space
+    проверяет свободное место: по плану до начала загрузки, а без плана — перед загрузкой
+    каждого продукта. bandwidth ограничивает скорость загрузки (байт/с) для этого вызова.
+    """
+    # Пул соединений клиента соответствует числу одновременных запросов загрузки
+    client = get_s3_client(access_key, secret_key, pool_size=max_workers * chunk_concurrency + list_workers)
+    transfer = {"chunk_size": chunk_size, "chunk_concurrency": chunk_concurrency}
+    if bandwidth:
+        transfer["bandwidth"] = TokenBucket(bandwidth)
+    make_path(target_directory)
+    index = ProductIndex(target_directory)
+    query_cache = QueryCache() if use_query_cache else None
+    screener = None
+    if aoi_cloud_percentage is not None:
+        screener = CloudScreener(client, input_shapefile, aoi_cloud_percentage, target_directory)
+    verifier = ProductVerifier(client, target_directory) if verify else None
+    log_run = stats is None
+    stats = stats or RunStats()
+    try:
+        s3_paths = iter_s3path(qp, satellite_grid, input_shapefile, product_policy, query_cache, stats)
+        listings = None
+        space = None
+        if order is not None:
+            plan = plan_downloads(client, index, s3_paths, target_directory, selection, transfer, stats=stats)
+            if check_space:
+                check_free_space(plan, target_directory)
+            plan.order(order, get_tile_list(satellite_grid, input_shapefile) if order == "tiles" else None)
+            s3_paths, listings = plan.products, plan.listings
+        elif check_space:
+            space = SpaceReservation(target_directory)
+        pipeline = DownloadPipeline(
+            client,
+            index,
+            target_directory,
+            reporter or Reporter(),
+            selection=selection,
+            screener=screener,
+            max_workers=max_workers,
+            list_workers=list_workers,
+            transfer=transfer,
+            download_slots=download_slots,
+            verifier=verifier,
+            stats=stats,
+            listings=listings,
+            space=space,
+        )
+        return pipeline.run(s3_paths)
+    finally:
+        log_retries()
+        if log_run:
+            log_stages(stats)
+        if query_cache is not None:
+            query_cache.close()
+        if screener is not None:
+            screener.close()
+        if verifier is not None:
+            verifier.close()
+        index.close()
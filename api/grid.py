@@ -0,0 +1,122 @@
+import functools
+import json
+import os
+
+import geopandas as gpd
+import numpy as np
+import shapely
+from pyproj import CRS
+
+from api.shared import Singleton, write_atomic
+
+GRID_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "gui",
+    "sentinel2_grid",
+    "sentinel_2_index_shapefile.shp",
+)
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".sentinel2_downloader", "grid")
+CACHE_VERSION = 1
+
+
+
+class SentinelGrid:
+    """
+    Компактная сетка тайлов Sentinel-2.
+
+    Имена тайлов и их охваты хранятся в массивах NumPy, геометрии — одним блоком WKB,
+    из которого декодируются только нужные тайлы и только при первом обращении.
+    """
+
+    def __init__(self, names, bounds, offsets, wkb, crs):
+        self.names = names
+        self.bounds = bounds
+        self.offsets = offsets
+        self.wkb = wkb
+        self.crs = crs
+        self._geometries = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def geometries(self, indices):
+        result = np.empty(len(indices), dtype=object)
+        for position, index in enumerate(indices):
+            geometry = self._geometries.get(index)
+            if geometry is None:
+                geometry = shapely.from_wkb(bytes(self.wkb[self.offsets[index] : self.offsets[index + 1]]))
+                self._geometries[index] = geometry
+            result[position] = geometry
+        return result
+
+    def query(self, geometry):
+        """Индексы тайлов, пересекающих geometry: отбор по охватам, затем точная проверка."""
+        xmin, ymin, xmax, ymax = geometry.bounds
+        bounds = self.bounds
+        candidates = np.flatnonzero(
+            (bounds[:, 0] <= xmax) & (bounds[:, 2] >= xmin) & (bounds[:, 1] <= ymax) & (bounds[:, 3] >= ymin)
+        )
+        shapely.prepare(geometry)
+        return candidates[shapely.intersects(geometry, self.geometries(candidates))]
+
+
+def _source_stamp(shapefile_path):
+    stat = os.stat(shapefile_path)
+    return {
+        "version": CACHE_VERSION,
+        "source": os.path.abspath(shapefile_path),
+        "mtime": stat.st_mtime,
+        "size": stat.st_size,
+    }
+
+
+def build_grid_cache(shapefile_path=GRID_PATH, cache_dir=CACHE_DIR):
+    """Сборка кэша сетки из шейп-файла."""
+    os.makedirs(cache_dir, exist_ok=True)
+    grid = gpd.read_file(shapefile_path)
+    # Файлы кэша пишутся под временными именами, чтобы прерванная сборка не оставила битый кэш
+    save = functools.partial(write_atomic, binary=True)
+
+    names = grid["Name"].to_numpy().astype(str)
+    bounds = np.ascontiguousarray(grid.geometry.bounds.to_numpy(dtype=np.float64))
+    wkb = shapely.to_wkb(grid.geometry.to_numpy())
+    offsets = np.zeros(len(wkb) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(item) for item in wkb])
+
+    save(os.path.join(cache_dir, "names.npy"), lambda file: np.save(file, names))
+    save(os.path.join(cache_dir, "bounds.npy"), lambda file: np.save(file, bounds))
+    save(os.path.join(cache_dir, "offsets.npy"), lambda file: np.save(file, offsets))
+    save(os.path.join(cache_dir, "geometry.wkb"), lambda file: file.write(b"".join(wkb)))
+
+    meta = dict(_source_stamp(shapefile_path), crs=grid.crs.to_wkt() if grid.crs else None)
+    # meta.json пишется последним: его наличие означает, что кэш собран полностью
+    save(os.path.join(cache_dir, "meta.json"), lambda file: file.write(json.dumps(meta).encode("utf-8")))
+
+
+def load_grid(shapefile_path=GRID_PATH, cache_dir=CACHE_DIR):
+    """Загрузка сетки из кэша (с отображением в память), при необходимости кэш пересобирается."""
+    meta_path = os.path.join(cache_dir, "meta.json")
+    meta = None
+    if os.path.exists(meta_path):
+        with open(meta_path, encoding="utf-8") as file:
+            meta = json.load(file)
+    if meta is None or {key: meta.get(key) for key in _source_stamp(shapefile_path)} != _source_stamp(shapefile_path):
+        build_grid_cache(shapefile_path, cache_dir)
+        with open(meta_path, encoding="utf-8") as file:
+            meta = json.load(file)
+
+    return SentinelGrid(
+        names=np.load(os.path.join(cache_dir, "names.npy"), mmap_mode="r"),
+        bounds=np.load(os.path.join(cache_dir, "bounds.npy"), mmap_mode="r"),
+        offsets=np.load(os.path.join(cache_dir, "offsets.npy"), mmap_mode="r"),
+        wkb=np.memmap(os.path.join(cache_dir, "geometry.wkb"), dtype=np.uint8, mode="r"),
+        crs=CRS.from_wkt(meta["crs"]) if meta["crs"] else None,
+    )
+
+
+_grid = Singleton(load_grid)
+
+
+def get_grid():
+    """Общая сетка Sentinel-2 (загружается при первом вызове)."""
+    return _grid.get()
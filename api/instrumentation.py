@@ -0,0 +1,130 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from api.retry import metrics as retry_metrics
+from api.shared import write_atomic
+
+METRICS_PREFIX = "sentinel2"
+
+
+class RunStats:
+    """
+    Таймеры стадий и счётчики одного запуска загрузки.
+
+    Время стадии суммируется по всем потокам, которые в ней работали, поэтому для
+    параллельных стадий (список объектов, передача) оно может превышать длительность
+    запуска. Стадии могут быть вложенными: search включает proxy_discovery и catalogue.
+    Ожидание в очередях конвейера учитывается отдельными стадиями queue_put.* и queue_get.*:
+    по ним видно, какая стадия ждёт соседнюю. Объект потокобезопасен и может быть общим для
+    нескольких одновременных загрузок.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.clock = time.perf_counter()
+        self.stages = {}
+        self.counters = {}
+
+    def add(self, stage, seconds):
+        with self.lock:
+            timer = self.stages.setdefault(stage, {"calls": 0, "seconds": 0.0, "max_seconds": 0.0})
+            timer["calls"] += 1
+            timer["seconds"] += seconds
+            timer["max_seconds"] = max(timer["max_seconds"], seconds)
+
+    @contextmanager
+    def stage(self, stage):
+        """Контекст, время выполнения которого учитывается в стадии stage."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - started)
+
+    def timed(self, stage, iterable):
+        """Выдать элементы iterable, учитывая время получения каждого в стадии stage."""
+        iterator = iter(iterable)
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add(stage, time.perf_counter() - started)
+                return
+            self.add(stage, time.perf_counter() - started)
+            yield item
+
+    def count(self, counter, value=1):
+        with self.lock:
+            self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def report(self, **details):
+        """Отчёт о запуске: длительность, стадии, счётчики и повторы запросов по сервисам."""
+        with self.lock:
+            stages = {
+                name: {key: round(value, 6) if isinstance(value, float) else value for key, value in timer.items()}
+                for name, timer in sorted(self.stages.items())
+            }
+            counters = dict(sorted(self.counters.items()))
+        return {
+            "started": datetime.fromtimestamp(self.started, timezone.utc).isoformat(timespec="seconds"),
+            "elapsed": round(time.perf_counter() - self.clock, 6),
+            **details,
+            "stages": stages,
+            "counters": counters,
+            # Повторы считаются общими Retrier, то есть для всего процесса
+            "retries": retry_metrics(),
+        }
+
+    def write_report(self, path, **details):
+        content = json.dumps(self.report(**details), ensure_ascii=False, indent=2)
+        # Файл заменяется целиком, чтобы сборщик метрик не прочитал его наполовину записанным
+        write_atomic(path, lambda file: file.write(content))
+
+    def prometheus(self, prefix=METRICS_PREFIX):
+        """Отчёт в текстовом формате Prometheus (для node_exporter textfile или Pushgateway)."""
+        report = self.report()
+        lines = [
+            f"# HELP {prefix}_run_elapsed_seconds Длительность запуска.",
+            f"# TYPE {prefix}_run_elapsed_seconds gauge",
+            f"{prefix}_run_elapsed_seconds {report['elapsed']}",
+        ]
+        for metric, key, text in (
+            ("stage_seconds_total", "seconds", "Время стадии, суммарно по потокам."),
+            ("stage_calls_total", "calls", "Число выполнений стадии."),
+            ("stage_max_seconds", "max_seconds", "Наибольшая длительность одного выполнения стадии."),
+        ):
+            kind = "gauge" if key == "max_seconds" else "counter"
+            lines += [f"# HELP {prefix}_{metric} {text}", f"# TYPE {prefix}_{metric} {kind}"]
+            lines += [f'{prefix}_{metric}{{stage="{name}"}} {timer[key]}' for name, timer in report["stages"].items()]
+        for name, value in report["counters"].items():
+            lines += [f"# TYPE {prefix}_{name}_total counter", f"{prefix}_{name}_total {value}"]
+        for key in ("calls", "retries", "throttled", "failures", "backoff_seconds"):
+            lines.append(f"# TYPE {prefix}_requests_{key}_total counter")
+            lines += [
+                f'{prefix}_requests_{key}_total{{service="{service}"}} {round(counters[key], 6)}'
+                for service, counters in report["retries"].items()
+            ]
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path, prefix=METRICS_PREFIX):
+        content = self.prometheus(prefix)
+        write_atomic(path, lambda file: file.write(content))
+
+
+def log_stages(stats):
+    """Запись в журнал времени стадий запуска, от самой долгой к самой короткой."""
+    report = stats.report()
+    stages = sorted(report["stages"].items(), key=lambda item: item[1]["seconds"], reverse=True)
+    if not stages:
+        return
+    print(f"Время стадий за {report['elapsed']:.1f} с (суммарно по потокам):")
+    for name, timer in stages:
+        print(
+            f"  {name}: {timer['seconds']:.2f} с, выполнений {timer['calls']}, "
+            f"наибольшее {timer['max_seconds']:.2f} с"
+        )
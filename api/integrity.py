@@ -0,0 +1,195 @@
+import hashlib
+import math
+import os
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+
+from api.retry import get_retrier
+from api.transport import BUCKET
+
+MiB = 1024 * 1024
+HASH_BUFFER = 8 * MiB
+HASH_WORKERS = min(8, os.cpu_count() or 1)
+MANIFEST_NAME = "manifest.safe"
+
+
+def _local_name(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def parse_manifest(content):
+    """Контрольные суммы MD5 файлов продукта из manifest.safe: {путь относительно .SAFE: md5}."""
+    checksums = {}
+    for element in ET.fromstring(content).iter():
+        if _local_name(element.tag) != "byteStream":
+            continue
+        href = None
+        md5 = None
+        for child in element.iter():
+            name = _local_name(child.tag)
+            if name == "fileLocation":
+                href = child.get("href")
+            elif name == "checksum" and child.get("checksumName", "").upper() == "MD5":
+                md5 = (child.text or "").strip().lower()
+        if href and md5:
+            checksums[os.path.normpath(href).replace(os.sep, "/")] = md5
+    return checksums
+
+
+# Распространённые размеры частей многочастной загрузки в S3
+PART_SIZES = (8 * MiB, 16 * MiB, 5 * MiB, 64 * MiB)
+
+
+def multipart_part_sizes(size, parts):
+    """Возможные размеры частей объекта размером size, загруженного parts частями."""
+    guesses = [max(math.ceil(size / parts / MiB), 1) * MiB, *PART_SIZES]
+    return [part_size for part_size in dict.fromkeys(guesses) if math.ceil(size / part_size) == parts]
+
+
+class _PartDigest:
+    def __init__(self, part_size):
+        self.part_size = part_size
+        self.digests = []
+        self.part = hashlib.md5()
+        self.filled = 0
+
+    def update(self, data):
+        view = memoryview(data)
+        while view:
+            piece = view[: self.part_size - self.filled]
+            self.part.update(piece)
+            self.filled += len(piece)
+            view = view[len(piece) :]
+            if self.filled == self.part_size:
+                self.digests.append(self.part.digest())
+                self.part = hashlib.md5()
+                self.filled = 0
+
+    def etag(self):
+        digests = self.digests + ([self.part.digest()] if self.filled else [])
+        return hashlib.md5(b"".join(digests)).hexdigest() + f"-{len(digests)}"
+
+
+def hash_file(path, size, etag=None, buffer_size=HASH_BUFFER):
+    """
+    Потоковое вычисление MD5 файла буферами buffer_size байт и проверка ETag хранилища.
+
+    ETag однократной загрузки объекта равен MD5 файла. ETag многочастной загрузки
+    («md5-N») зависит от неизвестного размера частей, поэтому сверяется с несколькими
+    возможными размерами за тот же проход. Возвращает MD5 и признак совпадения ETag:
+    None, если ETag не задан или многочастный ETag не совпал ни с одним размером частей.
+    """
+    etag = (etag or "").strip('"').lower()
+    parts = int(etag.rsplit("-", 1)[1]) if "-" in etag else 0
+    chains = [_PartDigest(part_size) for part_size in multipart_part_sizes(size, parts)] if parts else []
+
+    digest = hashlib.md5()
+    with open(path, "rb") as file:
+        for data in iter(lambda: file.read(buffer_size), b""):
+            # hashlib освобождает GIL на больших буферах, поэтому потоки пула считают параллельно
+            digest.update(data)
+            for chain in chains:
+                chain.update(data)
+
+    md5 = digest.hexdigest()
+    if not etag:
+        etag_ok = None
+    elif parts:
+        # Несовпадение может означать неверно угаданный размер частей, а не повреждение
+        etag_ok = True if any(chain.etag() == etag for chain in chains) else None
+    else:
+        etag_ok = md5 == etag
+    return {"md5": md5, "etag": etag_ok}
+
+
+def relative_key(s3path, key):
+    """Путь объекта key относительно папки продукта s3path (.SAFE)."""
+    return key[len(s3path) + 1 :] if key.startswith(s3path + "/") else key
+
+
+class ProductVerifier:
+    """
+    Проверка целостности загруженных объектов по manifest.safe и ETag хранилища.
+
+    Хеши считаются в пуле из max_workers потоков по мере загрузки объектов, параллельно
+    с загрузкой остальных. Объект считается повреждённым, если его MD5 не совпадает
+    с контрольной суммой из manifest.safe или, для файлов вне манифеста, с ETag.
+    """
+
+    def __init__(self, client, target_directory, max_workers=HASH_WORKERS):
+        self.client = client
+        self.target_directory = target_directory
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="verify")
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+    def submit(self, obj):
+        """Начать хеширование загруженного объекта obj (словарь с Key, Size, ETag)."""
+        path = os.path.join(self.target_directory, obj["Key"])
+        return self.executor.submit(hash_file, path, obj["Size"], obj.get("ETag"))
+
+    def manifest(self, s3path):
+        """Контрольные суммы продукта: из загруженного manifest.safe или прямо из хранилища."""
+        key = f"{s3path}/{MANIFEST_NAME}"
+        path = os.path.join(self.target_directory, key)
+        if os.path.isfile(path):
+            with open(path, "rb") as file:
+                content = file.read()
+        else:
+            content = get_retrier("s3").call(lambda: self.client.get_object(Bucket=BUCKET, Key=key)["Body"].read())
+        return parse_manifest(content)
+
+    def corrupted(self, s3path, objects, hashes):
+        """
+        Ключи повреждённых объектов продукта s3path.
+
+        hashes — словарь {ключ: Future или результат hash_file} для проверяемых объектов.
+        """
+        checksums = self.manifest(s3path)
+        corrupted = []
+        for obj in objects:
+            if obj["Key"] not in hashes:
+                continue
+            result = hashes[obj["Key"]]
+            try:
+                if hasattr(result, "result"):
+                    result = result.result()
+            except OSError:
+                corrupted.append(obj["Key"])
+                continue
+            expected = checksums.get(relative_key(s3path, obj["Key"]))
+            if expected is not None:
+                valid = result["md5"] == expected
+            else:
+                valid = result["etag"] is not False
+            if not valid:
+                corrupted.append(obj["Key"])
+        return corrupted
+
+
+def verify_index(index, max_workers=HASH_WORKERS):
+    """
+    Проверить по локальным manifest.safe все загруженные продукты индекса index (ProductIndex).
+
+    Повреждённые объекты отмечаются в индексе незагруженными и будут загружены заново при
+    следующем запуске. Возвращает число проверенных продуктов и число повреждённых объектов.
+    """
+    verifier = ProductVerifier(None, index.target_directory, max_workers)
+    checked = 0
+    total = 0
+    try:
+        for s3path in index.complete_products():
+            if not os.path.isfile(os.path.join(index.target_directory, s3path, MANIFEST_NAME)):
+                continue
+            objects = [obj for obj in index.product_objects(s3path) if obj["complete"]]
+            hashes = {obj["Key"]: verifier.submit(obj) for obj in objects}
+            corrupted = verifier.corrupted(s3path, objects, hashes)
+            checked += 1
+            if corrupted:
+                print(f"Продукт {s3path.split('/')[-1]}: повреждено объектов {len(corrupted)}")
+                index.invalidate(s3path, corrupted)
+                total += len(corrupted)
+    finally:
+        verifier.close()
+    return checked, total
@@ -0,0 +1,188 @@
+import argparse
+import os
+import time
+
+from api.shared import SQLiteDatabase
+
+INDEX_NAME = ".sentinel2_index.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS products (
+    s3path TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    complete INTEGER NOT NULL DEFAULT 0,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS products_name ON products (name);
+CREATE TABLE IF NOT EXISTS objects (
+    s3path TEXT NOT NULL,
+    key TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    etag TEXT,
+    complete INTEGER NOT NULL DEFAULT 0,
+    local_etag TEXT,
+    PRIMARY KEY (s3path, key)
+);
+"""
+
+
+class ProductIndex(SQLiteDatabase):
+    """
+    Локальный индекс загруженных продуктов в SQLite.
+
+    Индекс хранится в папке загрузки и для каждого продукта (по пути S3 и имени) содержит
+    размеры и ETag его объектов и признак завершённости. Проверка «продукт уже загружен»
+    выполняется одним запросом по первичному ключу вместо обхода папки продукта.
+    """
+
+    def __init__(self, target_directory):
+        self.target_directory = target_directory
+        self.path = os.path.join(target_directory, INDEX_NAME)
+        super().__init__(self.path, SCHEMA)
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(objects)")]
+        if "local_etag" not in columns:
+            # ETag загруженной версии объекта появился в индексе позже
+            self.connection.execute("ALTER TABLE objects ADD COLUMN local_etag TEXT")
+
+    def is_complete(self, s3path, selection=None):
+        """
+        Загружен ли продукт: целиком или, если задан фильтр selection, только выбранные объекты.
+        """
+        if selection is None or selection.is_full:
+            with self.lock:
+                row = self.connection.execute("SELECT complete FROM products WHERE s3path = ?", (s3path,)).fetchone()
+            return bool(row and row[0])
+        objects = selection.filter(self.product_objects(s3path))
+        return bool(objects) and all(obj["complete"] for obj in objects)
+
+    def product_objects(self, s3path):
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT key, size, etag, complete FROM objects WHERE s3path = ? ORDER BY key", (s3path,)
+            ).fetchall()
+        return [
+            {"Key": key, "Size": size, "ETag": etag, "complete": bool(complete)} for key, size, etag, complete in rows
+        ]
+
+    def register(self, s3path, objects):
+        """
+        Записать список объектов продукта из хранилища S3.
+
+        Признак загрузки объекта сохраняется, только если его размер и ETag не изменились.
+        """
+        files = [obj for obj in objects if not obj["Key"].endswith("/")]
+
+        with self.transaction() as cursor:
+            known = {
+                key: (size, etag, complete, local_etag)
+                for key, size, etag, complete, local_etag in cursor.execute(
+                    "SELECT key, size, etag, complete, local_etag FROM objects WHERE s3path = ?", (s3path,)
+                )
+            }
+            cursor.execute("DELETE FROM objects WHERE s3path = ?", (s3path,))
+            rows = []
+            for obj in files:
+                size, etag, complete, local_etag = known.get(obj["Key"], (None, None, 0, None))
+                same = size == obj["Size"] and etag == obj.get("ETag")
+                rows.append((s3path, obj["Key"], obj["Size"], obj.get("ETag"), complete if same else 0, local_etag))
+            cursor.executemany(
+                "INSERT INTO objects (s3path, key, size, etag, complete, local_etag) VALUES (?, ?, ?, ?, ?, ?)", rows
+            )
+            complete = all(row[4] for row in rows)
+            cursor.execute(
+                "INSERT OR REPLACE INTO products (s3path, name, size, complete, updated) VALUES (?, ?, ?, ?, ?)",
+                (s3path, s3path.split("/")[-1], sum(row[2] for row in rows), int(complete), time.time()),
+            )
+
+    def object_done(self, s3path, key, etag=None):
+        """Отметить объект загруженным; продукт завершён, когда загружены все его объекты."""
+        with self.transaction() as cursor:
+            cursor.execute(
+                "UPDATE objects SET complete = 1, local_etag = ? WHERE s3path = ? AND key = ?", (etag, s3path, key)
+            )
+            self._update_product(cursor, s3path)
+
+    def invalidate(self, s3path, keys):
+        """
+        Отметить объекты keys незагруженными (например, при несовпадении контрольной суммы).
+
+        Локальные файлы объектов удаляются: иначе reconcile_product, сверяющий только размер
+        и ETag, снова счёл бы повреждённую копию загруженной и объект не загрузился бы заново.
+        """
+        with self.transaction() as cursor:
+            cursor.executemany(
+                "UPDATE objects SET complete = 0, local_etag = NULL WHERE s3path = ? AND key = ?",
+                [(s3path, key) for key in keys],
+            )
+            self._update_product(cursor, s3path)
+        for key in keys:
+            try:
+                os.remove(os.path.join(self.target_directory, key))
+            except FileNotFoundError:
+                pass
+
+    def complete_products(self):
+        with self.lock:
+            return [row[0] for row in self.connection.execute("SELECT s3path FROM products WHERE complete = 1")]
+
+    def _update_product(self, cursor, s3path):
+        remaining = cursor.execute(
+            "SELECT COUNT(*) FROM objects WHERE s3path = ? AND complete = 0", (s3path,)
+        ).fetchone()[0]
+        cursor.execute(
+            "UPDATE products SET complete = ?, updated = ? WHERE s3path = ?", (int(remaining == 0), time.time(), s3path)
+        )
+        return remaining == 0
+
+    def reconcile_product(self, s3path):
+        """
+        Сверить объекты продукта с файлами на диске, вернуть признак завершённости.
+
+        Файл считается загруженным, если совпадает его размер и он не был загружен
+        из другой версии объекта (с другим ETag).
+        """
+        with self.transaction() as cursor:
+            objects = cursor.execute(
+                "SELECT key, size, etag, local_etag FROM objects WHERE s3path = ?", (s3path,)
+            ).fetchall()
+            rows = []
+            for key, size, etag, local_etag in objects:
+                path = os.path.join(self.target_directory, key)
+                present = os.path.isfile(path) and os.path.getsize(path) == size
+                present = present and (local_etag is None or local_etag == etag)
+                rows.append((int(present), s3path, key))
+            cursor.executemany("UPDATE objects SET complete = ? WHERE s3path = ? AND key = ?", rows)
+            return self._update_product(cursor, s3path)
+
+    def reconcile(self):
+        """Пересинхронизировать весь индекс с содержимым папки загрузки."""
+        with self.lock:
+            paths = [row[0] for row in self.connection.execute("SELECT s3path FROM products")]
+        complete = sum(self.reconcile_product(s3path) for s3path in paths)
+        return complete, len(paths)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальный индекс загруженных продуктов Sentinel-2")
+    parser.add_argument("command", choices=["reconcile", "verify"])
+    parser.add_argument("directory", help="папка загрузки")
+    args = parser.parse_args()
+
+    index = ProductIndex(args.directory)
+    try:
+        if args.command == "verify":
+            from api.integrity import verify_index
+
+            checked, corrupted = verify_index(index)
+            print(f"Проверено продуктов по manifest.safe: {checked}, повреждённых объектов: {corrupted}")
+            return
+        complete, total = index.reconcile()
+        print(f"Индекс {index.path} сверен с диском: загружено продуктов {complete} из {total}")
+    finally:
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+import errno
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from api.instrumentation import RunStats
+from api.selection import ObjectSelection
+from api.transfer import CHUNK_CONCURRENCY, CHUNK_SIZE, resumable_bytes
+from api.transport import BUCKET, list_objects
+
+GiB = 1024 * 1024 * 1024
+PLAN_WORKERS = 8
+# Запас свободного места сверх загружаемых байтов: индекс, журналы диапазонов, растры облачности
+SPACE_MARGIN = GiB // 4
+# Порядок загрузки: size — сначала продукты, которым осталось меньше всего байтов;
+# tiles — по приоритету тайлов (первыми тайлы, покрывающие большую часть области интересов)
+ORDERS = ("size", "tiles")
+
+
+def product_tile(s3path):
+    """Номер тайла продукта из имени папки .SAFE, например 35UNV."""
+    return s3path.rstrip("/").split("/")[-1][39:44]
+
+
+def format_size(size):
+    return f"{size / GiB:.2f} ГБ"
+
+
+class DownloadPlan:
+    """
+    План загрузки: продукты в порядке загрузки и списки их объектов.
+
+    remaining — байты, которые осталось загрузить для каждого продукта, за вычетом
+    уже загруженных объектов и частично записанных файлов .part.
+    """
+
+    def __init__(self):
+        self.products = []
+        self.listings = {}
+        self.remaining = {}
+        self.unlisted = []
+
+    @property
+    def needed(self):
+        return sum(self.remaining.values())
+
+    def order(self, order, tiles=None):
+        """Упорядочить продукты по правилу order (см. ORDERS); при равенстве сохраняется порядок поиска."""
+        if order == "size":
+            self.products.sort(key=lambda s3path_prod: self.remaining.get(s3path_prod, 0))
+        elif order == "tiles":
+            priority = {tile: number for number, tile in enumerate(tiles or [])}
+            self.products.sort(key=lambda s3path_prod: priority.get(product_tile(s3path_prod), len(priority)))
+        elif order is not None:
+            raise ValueError(f"Неизвестный порядок загрузки: {order}")
+
+
+def plan_downloads(
+    client,
+    index,
+    s3_paths,
+    target_directory,
+    selection=None,
+    transfer=None,
+    workers=PLAN_WORKERS,
+    stats=None,
+):
+    """
+    Составить план загрузки продуктов из итератора путей S3.
+
+    Списки объектов всех ещё не загруженных продуктов запрашиваются параллельно в workers
+    потоков и сверяются с диском через индекс index (ProductIndex), поэтому известен точный
+    объём оставшейся загрузки. Если список объектов продукта получить не удалось, продукт
+    остаётся в плане без списка (unlisted): конвейер запросит его снова и сообщит об ошибке.
+    Продукты, которые затем отсеет проверка облачности, тоже учитываются, поэтому оценка
+    объёма может быть только завышенной.
+    """
+    selection = selection or ObjectSelection()
+    transfer = transfer or {}
+    stats = stats or RunStats()
+    plan = DownloadPlan()
+
+    def plan_product(s3path_prod):
+        s3path = s3path_prod.removeprefix(f"/{BUCKET}/")
+        if index.is_complete(s3path, selection):
+            return s3path_prod, None, 0
+        listing = list_objects(client, s3path)
+        index.register(s3path, listing)
+        index.reconcile_product(s3path)
+        complete = {obj["Key"] for obj in index.product_objects(s3path) if obj["complete"]}
+        remaining = 0
+        for obj in selection.filter(listing):
+            if obj["Key"].endswith("/") or obj["Key"] in complete:
+                continue
+            target = os.path.join(target_directory, obj["Key"])
+            remaining += obj["Size"] - resumable_bytes(
+                target,
+                obj["Size"],
+                obj.get("ETag"),
+                transfer.get("chunk_size", CHUNK_SIZE),
+                transfer.get("chunk_concurrency", CHUNK_CONCURRENCY),
+            )
+        return s3path_prod, listing, remaining
+
+    def plan_safely(s3path_prod):
+        try:
+            return plan_product(s3path_prod)
+        except Exception as e:
+            print(f"Не удалось получить список объектов продукта {s3path_prod.split('/')[-1]}: {e}")
+            return s3path_prod, None, None
+
+    with stats.stage("planning"), ThreadPoolExecutor(max_workers=workers, thread_name_prefix="plan") as executor:
+        for s3path_prod, listing, remaining in executor.map(plan_safely, s3_paths):
+            plan.products.append(s3path_prod)
+            if remaining is None:
+                plan.unlisted.append(s3path_prod)
+                continue
+            plan.remaining[s3path_prod] = remaining
+            if listing is not None:
+                plan.listings[s3path_prod.removeprefix(f"/{BUCKET}/")] = listing
+    return plan
+
+
+class SpaceReservation:
+    """
+    Проверка свободного места по мере поступления продуктов при потоковой загрузке.
+
+    Перед загрузкой продукта его объём резервируется, после загрузки каждого объекта резерв
+    уменьшается на его размер. Если резерв с запасом margin не помещается на томе, бросается
+    OSError(ENOSPC): продукт не загружается, а остальные продукты загружаются, если помещаются.
+    """
+
+    def __init__(self, target_directory, margin=SPACE_MARGIN):
+        self.target_directory = target_directory
+        self.margin = margin
+        self.lock = threading.Lock()
+        self.reserved = 0
+
+    def reserve(self, size):
+        with self.lock:
+            free = shutil.disk_usage(self.target_directory).free
+            if size and self.reserved + size + self.margin > free:
+                raise OSError(
+                    errno.ENOSPC,
+                    f"Недостаточно места в {self.target_directory}: необходимо {format_size(size + self.margin)} "
+                    f"(с запасом {format_size(self.margin)}), свободно {format_size(max(free - self.reserved, 0))}",
+                )
+            self.reserved += size
+
+    def release(self, size):
+        with self.lock:
+            self.reserved -= size
+
+
+def check_free_space(plan, target_directory, margin=SPACE_MARGIN):
+    """
+    Проверить, что на томе target_directory хватит места для плана plan.
+
+    При нехватке места бросается OSError(ENOSPC) до начала загрузки, чтобы том
+    не заполнился на середине и не остались неполные продукты.
+    """
+    free = shutil.disk_usage(target_directory).free
+    needed = plan.needed
+    print(
+        f"Продуктов: {len(plan.products)}, необходимо загрузить {format_size(needed)}, "
+        f"свободно {format_size(free)}"
+    )
+    if plan.unlisted:
+        print(f"Объём продуктов без списка объектов не учтён: {len(plan.unlisted)}")
+    if needed and needed + margin > free:
+        raise OSError(
+            errno.ENOSPC,
+            f"Недостаточно места в {target_directory}: необходимо {format_size(needed + margin)} "
+            f"(с запасом {format_size(margin)}), свободно {format_size(free)}",
+        )
@@ -0,0 +1,72 @@
+import re
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import shapely
+from shapely.geometry import shape
+
+PRODUCT_NAME = re.compile(
+    r"^(?P<mission>S2[A-D])_MSI(?P<level>L1C|L2A)_(?P<sensing>\d{8}T\d{6})_N(?P<baseline>\d{4})"
+    r"_R(?P<orbit>\d{3})_T(?P<tile>[0-9A-Z]{5})_(?P<discriminator>\d{8}T\d{6})(?:\.SAFE)?$"
+)
+POLICIES = ("baseline", "cloud", "coverage")
+
+
+def parse_product_name(name):
+    """
+    Разбор имени продукта Sentinel-2, например
+    S2A_MSIL2A_20240101T092401_N0510_R093_T35UNV_20240101T112000.SAFE.
+    """
+    match = PRODUCT_NAME.match(name)
+    if match is None:
+        raise ValueError(f"Неизвестный формат имени продукта: {name}")
+    sensing = datetime.strptime(match["sensing"], "%Y%m%dT%H%M%S")
+    return {
+        "mission": match["mission"],
+        "level": match["level"],
+        "sensing": sensing,
+        "date": sensing.date(),
+        "baseline": int(match["baseline"]),
+        "orbit": int(match["orbit"]),
+        "tile": match["tile"],
+        "discriminator": datetime.strptime(match["discriminator"], "%Y%m%dT%H%M%S"),
+    }
+
+
+def product_cloud_cover(product):
+    for attribute in product.get("Attributes", []):
+        if attribute.get("Name") == "cloudCover":
+            return float(attribute["Value"])
+    return np.nan
+
+
+def select_best_products(products, policy="baseline"):
+    """
+    Выбор одного продукта каталога на тайл и дату съёмки.
+
+    Повторно обработанные версии (N0500 и N0509) и части одного витка над тем же тайлом
+    в тот же день сводятся к одному продукту: с последней версией обработки (baseline),
+    с наименьшей облачностью (cloud, нужны атрибуты $expand=Attributes) или с наибольшим
+    покрытием тайла данными (coverage, по GeoFootprint). Порядок продуктов сохраняется.
+    """
+    if policy not in POLICIES:
+        raise ValueError(f"Неизвестное правило выбора продуктов: {policy}")
+    if not products:
+        return []
+
+    records = pd.DataFrame([parse_product_name(product["Name"]) for product in products])
+    records["position"] = np.arange(len(products))
+    records["cloud"] = [product_cloud_cover(product) for product in products]
+    records["coverage"] = shapely.area(
+        np.array([shape(product["GeoFootprint"]) if product.get("GeoFootprint") else None for product in products])
+    )
+
+    keys = {
+        "baseline": (["baseline", "discriminator"], [False, False]),
+        "cloud": (["cloud", "baseline", "discriminator"], [True, False, False]),
+        "coverage": (["coverage", "baseline", "discriminator"], [False, False, False]),
+    }
+    columns, ascending = keys[policy]
+    best = records.sort_values(columns, ascending=ascending, na_position="last").drop_duplicates(["tile", "date"])
+    return [products[position] for position in sorted(best["position"])]
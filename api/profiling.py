@@ -0,0 +1,109 @@
+import collections
+import cProfile
+import os
+import pstats
+import sys
+import threading
+
+SAMPLE_INTERVAL = 0.005
+TOP_FUNCTIONS = 25
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """
+    Выборочный профилировщик всех потоков процесса.
+
+    Каждые interval секунд фоновый поток снимает стеки всех остальных потоков
+    (sys._current_frames) и считает одинаковые стеки. В отличие от cProfile, который видит
+    только включивший его поток, учитываются и потоки конвейера загрузки; накладные
+    расходы не зависят от числа вызовов функций. Результат сохраняется в формате
+    «свёрнутых стеков» (flamegraph.pl, speedscope).
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop.set()
+        self.thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self.stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def write_collapsed(self, path):
+        with open(path, "w", encoding="utf-8") as file:
+            for stack, count in self.stacks.most_common():
+                file.write(f"{stack} {count}\n")
+
+    def top(self, limit=TOP_FUNCTIONS):
+        """Функции с наибольшим собственным временем: [(функция, доля выборок)]."""
+        own = collections.Counter()
+        total = sum(self.stacks.values()) or 1
+        for stack, count in self.stacks.items():
+            own[stack.rsplit(";", 1)[-1]] += count
+        return [(name, count / total) for name, count in own.most_common(limit)]
+
+
+class Profiler:
+    """
+    Профилирование запуска: mode "sampling" (SamplingProfiler, все потоки) или "cprofile"
+    (детерминированный cProfile; до Python 3.12 видит только поток, в котором включён,
+    начиная с 3.12 — все потоки). Результат сохраняется в path: свёрнутые стеки или pstats.
+    """
+
+    def __init__(self, path, mode="sampling", interval=SAMPLE_INTERVAL):
+        self.path = path
+        self.mode = mode
+        self.profiler = SamplingProfiler(interval) if mode == "sampling" else cProfile.Profile()
+
+    def start(self):
+        if self.mode == "sampling":
+            self.profiler.__enter__()
+        else:
+            self.profiler.enable()
+
+    def stop(self):
+        """Остановить профилирование, сохранить результат и записать в журнал самые затратные функции."""
+        if self.mode == "sampling":
+            self.profiler.__exit__(None, None, None)
+            self.profiler.write_collapsed(self.path)
+            print(f"Профиль ({self.profiler.samples} выборок) сохранён в {self.path}. Собственное время:")
+            for name, share in self.profiler.top():
+                print(f"  {share:6.1%}  {name}")
+        else:
+            self.profiler.disable()
+            self.profiler.dump_stats(self.path)
+            print(f"Профиль cProfile сохранён в {self.path}")
+            pstats.Stats(self.profiler, stream=sys.stdout).sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
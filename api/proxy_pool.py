@@ -0,0 +1,242 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+
+from api.shared import Singleton, write_atomic
+from api.transport import CATALOGUE_URL, get_http_session
+
+STATE_PATH = os.path.join(os.path.expanduser("~"), ".sentinel2_downloader", "proxies.json")
+DIRECT = "direct"
+RACE_SIZE = 2
+PROBE_TIMEOUT = 5
+PROBE_WORKERS = 16
+# Пул считается достаточным, если столько кандидатов недавно отвечали успешно
+MIN_HEALTHY = 3
+# Вес предыдущих наблюдений: старые успехи и отказы постепенно забываются
+DECAY = 0.9
+LATENCY_WEIGHT = 0.3
+# Кандидат (кроме прямого соединения) удаляется из пула после стольких отказов подряд
+MAX_FAILURES = 3
+# Сколько лучших кандидатов пробуется для одного запроса, прежде чем ошибка передаётся Retrier
+MAX_CANDIDATES = 6
+SAVE_INTERVAL = 30
+REFRESH_INTERVAL = 3600
+
+
+def fetch_free_proxies():
+    """Список общедоступных прокси (адреса вида http://host:port)."""
+    from fp.fp import FreeProxy
+
+    proxies = FreeProxy(timeout=1, rand=True).get_proxy_list(repeat=False)
+    return [proxy if "://" in proxy else f"http://{proxy}" for proxy in proxies]
+
+
+def is_server_answer(error):
+    """
+    Сервер ответил кодом ошибки, а не отказало соединение или прокси: повторять запрос через
+    другие прокси бесполезно. Ограничение скорости (429, 503) и временные ошибки сразу
+    передаются Retrier, который выдерживает паузу и снижает параллельность запросов.
+    """
+    if not isinstance(error, requests.HTTPError) or error.response is None:
+        return False
+    # 407 отвечает сам прокси, а не сервер
+    return error.response.status_code != 407
+
+
+def proxy_settings(candidate):
+    """Параметр proxies для requests: None для прямого соединения."""
+    if candidate == DIRECT:
+        return None
+    return {"http": candidate, "https": candidate}
+
+
+class ProxyPool:
+    """
+    Пул способов соединения с каталогом: прямое соединение и прокси, ранжированные по
+    измеренной задержке и доле успешных запросов.
+
+    Статистика хранится в path и переносится между запусками. Кандидаты проверяются
+    параллельно короткими запросами; список общедоступных прокси загружается, только если
+    прямое соединение не работает и исправных кандидатов меньше MIN_HEALTHY. Каждый запрос
+    одновременно отправляется через race лучших кандидатов и возвращается первый успешный
+    ответ; если все они отказали, пробуются следующие, всего не более limit кандидатов.
+    Прокси, отказавшие MAX_FAILURES раз подряд, удаляются из пула.
+    """
+
+    def __init__(
+        self,
+        path=STATE_PATH,
+        race=RACE_SIZE,
+        limit=MAX_CANDIDATES,
+        probe_timeout=PROBE_TIMEOUT,
+        probe_workers=PROBE_WORKERS,
+        source=fetch_free_proxies,
+    ):
+        self.path = path
+        self.race = race
+        self.limit = limit
+        self.probe_timeout = probe_timeout
+        self.probe_workers = probe_workers
+        self.source = source
+        self.lock = threading.Lock()
+        self.stats = self._load()
+        self.stats.setdefault(DIRECT, self._empty())
+        self.refreshed = None
+        self.saved = time.monotonic()
+        self.executor = ThreadPoolExecutor(max_workers=max(probe_workers, race * 4), thread_name_prefix="proxy")
+
+    @staticmethod
+    def _empty():
+        return {"successes": 0.0, "failures": 0.0, "latency": None, "streak": 0}
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as file:
+                loaded = json.load(file)
+        except (OSError, ValueError):
+            return {}
+        # В статистике, сохранённой прежними версиями, нет счётчика отказов подряд
+        return {
+            candidate: stats
+            for candidate, stats in loaded.items()
+            if candidate == DIRECT or stats.get("streak", 0) < MAX_FAILURES
+        }
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self.lock:
+            content = json.dumps(self.stats)
+            self.saved = time.monotonic()
+        write_atomic(self.path, lambda file: file.write(content))
+
+    def record(self, candidate, ok, latency=None):
+        with self.lock:
+            if not ok and candidate not in self.stats:
+                # Отказавший новый или уже удалённый из пула прокси не запоминается
+                return
+            stats = self.stats.setdefault(candidate, self._empty())
+            stats["successes"] *= DECAY
+            stats["failures"] *= DECAY
+            if ok:
+                stats["successes"] += 1
+                stats["streak"] = 0
+                if stats["latency"] is None:
+                    stats["latency"] = latency
+                else:
+                    stats["latency"] += LATENCY_WEIGHT * (latency - stats["latency"])
+            else:
+                stats["failures"] += 1
+                stats["streak"] = stats.get("streak", 0) + 1
+                if candidate != DIRECT and stats["streak"] >= MAX_FAILURES:
+                    del self.stats[candidate]
+            save = time.monotonic() - self.saved > SAVE_INTERVAL
+        if save:
+            self.save()
+
+    def score(self, candidate):
+        stats = self.stats[candidate]
+        success_rate = (stats["successes"] + 1) / (stats["successes"] + stats["failures"] + 2)
+        latency = stats["latency"] if stats["latency"] is not None else self.probe_timeout
+        return success_rate / max(latency, 0.01)
+
+    def ranked(self):
+        with self.lock:
+            return sorted(self.stats, key=self.score, reverse=True)
+
+    def healthy(self):
+        with self.lock:
+            return [
+                candidate
+                for candidate, stats in self.stats.items()
+                if stats["latency"] is not None and stats["successes"] > stats["failures"]
+            ]
+
+    def _probe_one(self, candidate):
+        started = time.monotonic()
+        try:
+            response = get_http_session().get(
+                CATALOGUE_URL,
+                params={"$top": 1, "$select": "Id"},
+                timeout=self.probe_timeout,
+                proxies=proxy_settings(candidate),
+            )
+            response.raise_for_status()
+            response.json()
+        except (requests.RequestException, ValueError):
+            self.record(candidate, False)
+            return
+        self.record(candidate, True, time.monotonic() - started)
+
+    def probe(self, candidates):
+        """Параллельная проверка кандидатов запросом к каталогу."""
+        list(self.executor.map(self._probe_one, candidates))
+        self.save()
+
+    def refresh(self):
+        """Пополнить пул общедоступными прокси, если прямое соединение не работает и исправных кандидатов мало."""
+        if self.refreshed is not None and time.monotonic() - self.refreshed < REFRESH_INTERVAL:
+            return
+        healthy = self.healthy()
+        if DIRECT in healthy or len(healthy) >= MIN_HEALTHY:
+            return
+        self.refreshed = time.monotonic()
+        try:
+            candidates = self.source()
+        except Exception as e:
+            print(f"Не удалось получить список прокси: {e}")
+            candidates = []
+        with self.lock:
+            known = set(self.stats)
+        self.probe([DIRECT] + [candidate for candidate in candidates if candidate not in known])
+
+    def request(self, send):
+        """
+        Выполнить send(proxies) через лучших кандидатов и вернуть первый успешный результат.
+
+        send должна бросать исключение, если ответ непригоден (ошибка HTTP, неверный JSON).
+        """
+        self.refresh()
+        candidates = self.ranked()[: self.limit]
+        error = None
+        for start in range(0, len(candidates), self.race):
+            result, error = self._race(send, candidates[start : start + self.race], error)
+            if error is None:
+                return result
+        # Последняя ошибка передаётся как есть, чтобы Retrier мог распознать ограничение скорости
+        raise error
+
+    def _race(self, send, candidates, error):
+        def attempt(candidate):
+            started = time.monotonic()
+            try:
+                result = send(proxy_settings(candidate))
+            except Exception as e:
+                # Ответ сервера, даже с ошибкой, означает, что кандидат исправен
+                self.record(candidate, is_server_answer(e), time.monotonic() - started)
+                raise
+            self.record(candidate, True, time.monotonic() - started)
+            return result
+
+        pending = {self.executor.submit(attempt, candidate) for candidate in candidates}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    # Остальные запросы завершатся в фоне и только обновят статистику
+                    return future.result(), None
+                error = future.exception()
+                if is_server_answer(error):
+                    raise error
+        return None, error or requests.ConnectionError("нет доступных кандидатов")
+
+
+_pool = Singleton(ProxyPool)
+
+
+def get_proxy_pool():
+    """Общий пул прокси (создаётся при первом вызове)."""
+    return _pool.get()
@@ -0,0 +1,173 @@
+import hashlib
+import json
+import os
+import time
+from datetime import timedelta
+
+from api.catalogue import WINDOW_OVERLAP, format_time, parse_time, query_footprints, query_interval, utc_now
+from api.shared import SQLiteDatabase
+
+CACHE_PATH = os.path.join(os.path.expanduser("~"), ".sentinel2_downloader", "catalogue.sqlite")
+CACHE_TTL = 6 * 3600
+# Интервалы, закончившиеся раньше этого срока до запроса, считаются окончательными и не устаревают
+STABLE_AGE = timedelta(days=30)
+CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS queries (
+    key TEXT PRIMARY KEY,
+    last_used REAL NOT NULL,
+    size INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS intervals (
+    key TEXT NOT NULL,
+    start TEXT NOT NULL,
+    end TEXT NOT NULL,
+    fetched REAL NOT NULL,
+    stable INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS intervals_key ON intervals (key);
+CREATE TABLE IF NOT EXISTS products (
+    key TEXT NOT NULL,
+    id TEXT NOT NULL,
+    start TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (key, id)
+);
+CREATE INDEX IF NOT EXISTS products_start ON products (key, start);
+"""
+
+
+def query_key(qp, expand_attributes=False):
+    """Ключ запроса без интервала дат: коллекция, тип продукта, облачность и хеш контуров."""
+    footprints = hashlib.sha256("\n".join(sorted(query_footprints(qp))).encode("utf-8")).hexdigest()
+    normalized = {
+        "collection": qp["setillite"],
+        "producttype": qp["producttype"],
+        "cloud_percentage": float(qp["cloud_percentage"]),
+        "footprint": footprints,
+        "attributes": bool(expand_attributes),
+    }
+    if qp.get("published_after"):
+        normalized["published_after"] = qp["published_after"]
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def subtract_intervals(start, end, covered):
+    """Части интервала (start, end), не покрытые интервалами covered."""
+    missing = []
+    cursor = start
+    for covered_start, covered_end in sorted(covered):
+        if covered_end <= cursor:
+            continue
+        if covered_start > cursor:
+            missing.append((cursor, min(covered_start, end)))
+        cursor = max(cursor, covered_end)
+        if cursor >= end:
+            break
+    if cursor < end:
+        missing.append((cursor, end))
+    return [(part_start, part_end) for part_start, part_end in missing if part_start < part_end]
+
+
+class QueryCache(SQLiteDatabase):
+    """
+    Кэш результатов поиска в каталоге на диске (SQLite).
+
+    Результаты хранятся по нормализованному ключу запроса вместе с покрытыми интервалами дат.
+    Для нового запроса с сервера запрашиваются только непокрытые или устаревшие (старше ttl)
+    части интервала, остальное берётся из кэша. Размер кэша ограничен max_bytes: при
+    превышении удаляются давно не использованные запросы.
+    """
+
+    def __init__(self, path=CACHE_PATH, ttl=CACHE_TTL, max_bytes=CACHE_MAX_BYTES):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        super().__init__(path, SCHEMA)
+
+    def missing_intervals(self, key, start, end):
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT start, end FROM intervals WHERE key = ? AND end > ? AND start < ? AND (stable = 1 OR fetched > ?)",
+                (key, start, end, time.time() - self.ttl),
+            ).fetchall()
+        return subtract_intervals(start, end, rows)
+
+    def products(self, key, start, end):
+        with self.lock:
+            self.connection.execute("UPDATE queries SET last_used = ? WHERE key = ?", (time.time(), key))
+            rows = self.connection.execute(
+                "SELECT data FROM products WHERE key = ? AND start > ? AND start < ? ORDER BY start", (key, start, end)
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def store(self, key, start, end, products):
+        """
+        Сохранить результат поиска за интервал (start, end), заменив прежние продукты интервала.
+
+        Записи интервалов, лежащих внутри (start, end), и устаревшие записи неокончательных
+        интервалов удаляются: они больше не используются, а таблица росла бы при каждом запуске.
+        """
+        now = time.time()
+        cutoff = format_time(utc_now() - STABLE_AGE)
+        intervals = [
+            (key, part_start, part_end, now, stable)
+            for part_start, part_end, stable in [(start, min(end, cutoff), 1), (max(start, cutoff), end, 0)]
+            if part_start < part_end
+        ]
+        rows = [(key, product["Id"], product["ContentDate"]["Start"], json.dumps(product)) for product in products]
+        with self.transaction() as cursor:
+            cursor.execute("DELETE FROM products WHERE key = ? AND start > ? AND start < ?", (key, start, end))
+            cursor.execute(
+                "DELETE FROM intervals WHERE key = ? "
+                "AND ((start >= ? AND end <= ?) OR (stable = 0 AND fetched <= ?))",
+                (key, start, end, now - self.ttl),
+            )
+            cursor.executemany("INSERT OR REPLACE INTO products (key, id, start, data) VALUES (?, ?, ?, ?)", rows)
+            cursor.executemany(
+                "INSERT INTO intervals (key, start, end, fetched, stable) VALUES (?, ?, ?, ?, ?)", intervals
+            )
+            size = cursor.execute("SELECT COALESCE(SUM(LENGTH(data)), 0) FROM products WHERE key = ?", (key,))
+            cursor.execute(
+                "INSERT OR REPLACE INTO queries (key, last_used, size) VALUES (?, ?, ?)",
+                (key, now, size.fetchone()[0]),
+            )
+        self.evict()
+
+    def evict(self):
+        """Удалить давно не использованные запросы, пока кэш больше max_bytes."""
+        with self.lock:
+            total = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM queries").fetchone()[0]
+            for key, size in self.connection.execute("SELECT key, size FROM queries ORDER BY last_used").fetchall():
+                if total <= self.max_bytes:
+                    break
+                for table in ("products", "intervals", "queries"):
+                    self.connection.execute(f"DELETE FROM {table} WHERE key = ?", (key,))
+                total -= size
+
+    def iter_products(self, qp, search, expand_attributes=False):
+        """
+        Продукты запроса qp: из кэша и, для непокрытых частей интервала, из search(qp_part).
+
+        search — функция, возвращающая итератор продуктов каталога для запроса qp_part
+        с явно заданными time_start и time_end.
+        """
+        key = query_key(qp, expand_attributes)
+        start, end = query_interval(qp)
+        missing = self.missing_intervals(key, start, end)
+
+        for product in self.products(key, start, end):
+            product_start = product["ContentDate"]["Start"]
+            if not any(part_start < product_start < part_end for part_start, part_end in missing):
+                yield product
+
+        for part_start, part_end in missing:
+            # Интервал запрашивается с небольшим запасом, чтобы не потерять продукт на границе
+            fetch_start = format_time(max(parse_time(part_start) - WINDOW_OVERLAP, parse_time(start)))
+            fetch_end = format_time(min(parse_time(part_end) + WINDOW_OVERLAP, parse_time(end)))
+            products = []
+            for product in search(dict(qp, time_start=fetch_start, time_end=fetch_end)):
+                products.append(product)
+                yield product
+            self.store(key, fetch_start, fetch_end, products)
@@ -0,0 +1,45 @@
+import json
+import threading
+import time
+
+PRESENT = "present"
+DOWNLOADING = "downloading"
+DOWNLOADED = "downloaded"
+CLOUDY = "cloudy"
+FAILED = "failed"
+
+FINAL_STATUSES = (PRESENT, DOWNLOADED, CLOUDY, FAILED)
+
+
+class Reporter:
+    """
+    Получатель событий конвейера загрузки.
+
+    Конвейер сообщает о смене статуса продукта (PRESENT, DOWNLOADING, DOWNLOADED, CLOUDY,
+    FAILED) и о начале загрузки продукта, передавая TransferMonitor для отображения прогресса.
+    Базовый класс ничего не делает: сообщения в журнал печатает сам конвейер.
+    """
+
+    def product_status(self, file_name, status, **details):
+        pass
+
+    def product_progress(self, file_name, monitor):
+        pass
+
+
+class JsonLinesReporter(Reporter):
+    """Запись итогового статуса каждого продукта в поток stream строкой JSON."""
+
+    def __init__(self, stream, job=None, lock=None):
+        self.stream = stream
+        self.job = job
+        self.lock = lock or threading.Lock()
+
+    def product_status(self, file_name, status, **details):
+        if status not in FINAL_STATUSES:
+            return
+        record = {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "job": self.job, "product": file_name, "status": status}
+        record.update(details)
+        with self.lock:
+            self.stream.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self.stream.flush()
@@ -0,0 +1,205 @@
+import email.utils
+import random
+import threading
+import time
+
+import requests
+import urllib3
+from botocore.exceptions import ClientError, HTTPClientError, IncompleteReadError
+from botocore.exceptions import ConnectionError as BotocoreConnectionError
+
+MAX_ATTEMPTS = 6
+BASE_DELAY = 1.0
+MAX_DELAY = 60.0
+MIN_LIMIT = 1
+# Множитель уменьшения параллельности при ограничении скорости (AIMD)
+DECREASE_FACTOR = 0.5
+# Повторное уменьшение не раньше чем через столько секунд: одна волна отказов — одно уменьшение
+DECREASE_COOLDOWN = 5.0
+
+THROTTLING_STATUSES = (429, 503)
+TRANSIENT_STATUSES = (500, 502, 504)
+THROTTLING_CODES = ("SlowDown", "Throttling", "ThrottlingException", "RequestLimitExceeded", "TooManyRequests")
+TRANSIENT_CODES = ("InternalError", "ServiceUnavailable", "RequestTimeout")
+
+_lock = threading.Lock()
+_retriers = {}
+
+
+def _parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        moment = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        # Начиная с Python 3.10 некорректная дата вызывает ValueError, а не возвращает None
+        return None
+    if moment is None:
+        return None
+    return max(moment.timestamp() - time.time(), 0.0)
+
+
+def classify(error):
+    """
+    Разбор ошибки запроса: (повторять ли, ограничение ли это скорости, Retry-After в секундах).
+    """
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        status = error.response.status_code
+        retry_after = _parse_retry_after(error.response.headers.get("Retry-After"))
+        if status in THROTTLING_STATUSES:
+            return True, True, retry_after
+        return status in TRANSIENT_STATUSES, False, retry_after
+    if isinstance(error, (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError)):
+        return True, False, None
+    if isinstance(error, ClientError):
+        code = error.response.get("Error", {}).get("Code")
+        metadata = error.response.get("ResponseMetadata", {})
+        status = metadata.get("HTTPStatusCode")
+        retry_after = _parse_retry_after(metadata.get("HTTPHeaders", {}).get("retry-after"))
+        if code in THROTTLING_CODES or status in THROTTLING_STATUSES:
+            return True, True, retry_after
+        return code in TRANSIENT_CODES or status in TRANSIENT_STATUSES, False, retry_after
+    if isinstance(error, (BotocoreConnectionError, HTTPClientError, IncompleteReadError, urllib3.exceptions.HTTPError)):
+        # Отказ установки соединения (EndpointConnectionError и др.) или обрыв, в том числе при чтении тела ответа
+        return True, False, None
+    return False, False, None
+
+
+class AdaptiveLimiter:
+    """
+    Ограничение числа одновременных запросов по схеме AIMD.
+
+    Пока сервис не ограничивает скорость, лимита нет. При первом отказе из-за ограничения
+    лимит становится равным доле DECREASE_FACTOR от числа выполняемых запросов и далее
+    уменьшается так же при каждой новой волне отказов, а после каждых limit успешных
+    запросов увеличивается на единицу, но не выше наибольшей наблюдавшейся параллельности.
+    """
+
+    def __init__(self, min_limit=MIN_LIMIT, decrease=DECREASE_FACTOR, cooldown=DECREASE_COOLDOWN):
+        self.min_limit = min_limit
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.condition = threading.Condition()
+        self.limit = None
+        self.in_flight = 0
+        self.peak = 0
+        self.waiting = 0
+        self.decreased = 0.0
+
+    def __enter__(self):
+        with self.condition:
+            self.waiting += 1
+            while self.limit is not None and self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.waiting -= 1
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+        return self
+
+    def __exit__(self, *exc_info):
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify()
+
+    def success(self):
+        with self.condition:
+            if self.limit is None:
+                return
+            self.limit = min(self.limit + 1 / self.limit, self.peak)
+            self.condition.notify()
+
+    def throttle(self):
+        now = time.monotonic()
+        with self.condition:
+            if now - self.decreased < self.cooldown:
+                return
+            self.decreased = now
+            current = self.in_flight if self.limit is None else self.limit
+            self.limit = max(self.min_limit, current * self.decrease)
+
+
+class Retrier:
+    """
+    Повтор запросов к сервису при временных ошибках и ограничении скорости.
+
+    Между попытками выдерживается экспоненциальная задержка со случайным разбросом (full
+    jitter), но не меньше Retry-After из ответа сервера. Параллельность запросов
+    регулирует AdaptiveLimiter. Счётчики доступны через metrics().
+    """
+
+    def __init__(self, name, max_attempts=MAX_ATTEMPTS, base_delay=BASE_DELAY, max_delay=MAX_DELAY):
+        self.name = name
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.limiter = AdaptiveLimiter()
+        self.lock = threading.Lock()
+        self.counters = {"calls": 0, "retries": 0, "throttled": 0, "failures": 0, "backoff_seconds": 0.0}
+
+    def _count(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def delay(self, attempt, retry_after=None):
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+        if retry_after is not None:
+            return max(min(retry_after, self.max_delay), backoff)
+        return backoff
+
+    def call(self, function, *args, before_retry=None, **kwargs):
+        """
+        Вызвать function(*args, **kwargs) с повторами. before_retry(error), если задана,
+        вызывается перед каждой повторной попыткой.
+        """
+        self._count("calls")
+        for attempt in range(self.max_attempts):
+            try:
+                with self.limiter:
+                    result = function(*args, **kwargs)
+            except Exception as e:
+                retryable, throttled, retry_after = classify(e)
+                if throttled:
+                    self._count("throttled")
+                    self.limiter.throttle()
+                if not retryable or attempt == self.max_attempts - 1:
+                    self._count("failures")
+                    raise
+                pause = self.delay(attempt, retry_after)
+                self._count("retries")
+                self._count("backoff_seconds", pause)
+                if before_retry is not None:
+                    before_retry(e)
+                time.sleep(pause)
+                continue
+            self.limiter.success()
+            return result
+
+    def metrics(self):
+        with self.lock:
+            counters = dict(self.counters)
+        with self.limiter.condition:
+            counters.update(
+                limit=None if self.limiter.limit is None else int(self.limiter.limit),
+                in_flight=self.limiter.in_flight,
+                waiting=self.limiter.waiting,
+            )
+        return counters
+
+
+def get_retrier(name):
+    """Общий Retrier сервиса name (catalogue, s3), один на всё время работы программы."""
+    with _lock:
+        if name not in _retriers:
+            _retriers[name] = Retrier(name)
+        return _retriers[name]
+
+
+def metrics():
+    """Счётчики всех Retrier по именам сервисов."""
+    with _lock:
+        retriers = list(_retriers.values())
+    return {retrier.name: retrier.metrics() for retrier in retriers}
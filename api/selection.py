@@ -0,0 +1,55 @@
+import os
+
+RESOLUTIONS = ("R10m", "R20m", "R60m")
+# Каналы L1C и L2A и слои L2A: истинный цвет, аэрозоли, водяной пар, классификация сцены
+BANDS = tuple(f"B{number:02d}" for number in range(1, 13)) + ("B8A", "TCI", "AOT", "WVP", "SCL")
+
+
+class ObjectSelection:
+    """
+    Фильтр объектов продукта SAFE.
+
+    bands — имена каналов и слоёв (B02, B8A, TCI, SCL, ...), resolutions — папки разрешений
+    L2A (R10m, R20m, R60m); None означает «все». masks включает содержимое QI_DATA, metadata —
+    остальные файлы продукта (manifest.safe, XML-метаданные, AUX_DATA, DATASTRIP, ...).
+    Неизвестные имена каналов и разрешений вызывают ValueError.
+    """
+
+    def __init__(self, bands=None, resolutions=None, masks=True, metadata=True):
+        self.bands = {band.upper() for band in bands} if bands else None
+        self.resolutions = set(resolutions) if resolutions else None
+        unknown = sorted((self.bands or set()) - set(BANDS)) + sorted((self.resolutions or set()) - set(RESOLUTIONS))
+        if unknown:
+            raise ValueError(f"Неизвестные каналы или разрешения: {', '.join(unknown)}")
+        self.masks = masks
+        self.metadata = metadata
+
+    @property
+    def is_full(self):
+        return (
+            self.bands is None
+            and (self.resolutions is None or self.resolutions >= set(RESOLUTIONS))
+            and self.masks
+            and self.metadata
+        )
+
+    def matches(self, key):
+        if key.endswith("/"):
+            # Пустые каталоги нужны только при загрузке продукта целиком
+            return self.is_full
+        parts = key.split(".SAFE/", 1)[-1].split("/")
+
+        if "IMG_DATA" in parts:
+            folder = parts[parts.index("IMG_DATA") + 1]
+            if self.resolutions is not None and folder in RESOLUTIONS and folder not in self.resolutions:
+                return False
+            # T35UNV_20240101T092401_B02_10m.jp2 (L2A) или T35UNV_20240101T092401_B02.jp2 (L1C)
+            name_parts = os.path.splitext(parts[-1])[0].split("_")
+            band = name_parts[2].upper() if len(name_parts) > 2 else ""
+            return self.bands is None or band in self.bands
+        if "QI_DATA" in parts:
+            return self.masks
+        return self.metadata
+
+    def filter(self, objects):
+        return [obj for obj in objects if self.matches(obj["Key"])]
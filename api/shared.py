@@ -0,0 +1,62 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+class Singleton:
+    """Значение, которое создаёт factory при первом запросе; далее оно общее для всех потоков программы."""
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.lock = threading.Lock()
+        self.value = None
+
+    def get(self):
+        with self.lock:
+            if self.value is None:
+                self.value = self.factory()
+            return self.value
+
+
+class SQLiteDatabase:
+    """
+    База SQLite с одним соединением на все потоки.
+
+    Журнал WAL позволяет читать базу во время записи; запросы выполняются под блокировкой
+    lock, изменения из нескольких запросов — в транзакции transaction().
+    """
+
+    def __init__(self, path, schema):
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(schema)
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    @contextmanager
+    def transaction(self):
+        """Курсор транзакции: изменения фиксируются по выходе из блока и откатываются при исключении."""
+        with self.lock:
+            cursor = self.connection.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                yield cursor
+                cursor.execute("COMMIT")
+            except BaseException:
+                cursor.execute("ROLLBACK")
+                raise
+
+
+def write_atomic(path, write, binary=False):
+    """
+    Записать файл path функцией write(file) под временным именем и затем заменить им path,
+    чтобы читатель или прерванная запись не оставили файл записанным наполовину.
+    """
+    temporary = path + ".tmp"
+    with open(temporary, "wb") if binary else open(temporary, "w", encoding="utf-8") as file:
+        write(file)
+    os.replace(temporary, path)
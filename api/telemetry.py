@@ -0,0 +1,119 @@
+import threading
+import time
+from collections import deque
+
+SAMPLE_INTERVAL = 0.25
+INSTANT_WINDOW = 2.0
+AVERAGE_WINDOW = 15.0
+
+
+class _Counter:
+    def __init__(self, size=0, done=0):
+        self.size = size
+        self.done = done
+        self.transferred = 0
+        self.started = time.monotonic()
+        self.finished = None
+        self.state = "загрузка"
+        self.objects = {}
+        self.samples = deque([(self.started, 0)])
+
+    def add(self, count, transferred, now):
+        self.done += count
+        if transferred:
+            self.transferred += count
+            if now - self.samples[-1][0] >= SAMPLE_INTERVAL:
+                self.samples.append((now, self.transferred))
+            while len(self.samples) > 2 and now - self.samples[1][0] > AVERAGE_WINDOW:
+                self.samples.popleft()
+
+    def rate(self, window, now):
+        """Скорость передачи (байт/с) за последние window секунд."""
+        if self.finished is not None:
+            return 0.0
+        start_time, start_bytes = self.samples[0]
+        for sample_time, sample_bytes in self.samples:
+            if now - sample_time <= window:
+                break
+            start_time, start_bytes = sample_time, sample_bytes
+        elapsed = now - start_time
+        return (self.transferred - start_bytes) / elapsed if elapsed > 0 else 0.0
+
+    def snapshot(self, now):
+        speed = self.rate(INSTANT_WINDOW, now)
+        average_speed = self.rate(AVERAGE_WINDOW, now)
+        remaining = max(self.size - self.done, 0)
+        objects = {}
+        for state in self.objects.values():
+            objects[state] = objects.get(state, 0) + 1
+        return {
+            "state": self.state,
+            "size": self.size,
+            "done": min(self.done, self.size) if self.size else self.done,
+            "transferred": self.transferred,
+            "percent": min(int(self.done * 100 / self.size), 100) if self.size else 100,
+            "speed": speed,
+            "average_speed": average_speed,
+            "eta": remaining / average_speed if average_speed > 0 else None,
+            "elapsed": (self.finished or now) - self.started,
+            "objects": objects,
+        }
+
+
+class TransferMonitor:
+    """
+    Телеметрия загрузки, получаемая из обратных вызовов передачи байтов.
+
+    Загрузчик сообщает о каждом прочитанном блоке, а монитор ведёт счётчики по продуктам
+    и общий счётчик: переданные байты, мгновенную и скользящую среднюю скорость, оценку
+    оставшегося времени и состояние объектов. Интерфейс и журнал получают эти данные через
+    snapshot() и подписку, не обращаясь к файловой системе.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.products = {}
+        self.total = _Counter()
+        self.listeners = []
+
+    def subscribe(self, listener):
+        """Подписать listener(event, name, snapshot) на события start, done и failed."""
+        self.listeners.append(listener)
+
+    def _notify(self, event, name):
+        snapshot = self.snapshot(name)
+        for listener in self.listeners:
+            listener(event, name, snapshot)
+
+    def start_product(self, name, size, done=0, objects=()):
+        with self.lock:
+            counter = _Counter(size, done)
+            counter.objects = {key: "в очереди" for key in objects}
+            self.products[name] = counter
+            self.total.size += size
+            self.total.done += done
+        self._notify("start", name)
+
+    def add_bytes(self, name, count, transferred=True):
+        now = time.monotonic()
+        with self.lock:
+            self.products[name].add(count, transferred, now)
+            self.total.add(count, transferred, now)
+
+    def object_state(self, name, key, state):
+        with self.lock:
+            self.products[name].objects[key] = state
+
+    def finish_product(self, name, failed=False):
+        with self.lock:
+            counter = self.products[name]
+            counter.finished = time.monotonic()
+            counter.state = "ошибка" if failed else "загружено"
+        self._notify("failed" if failed else "done", name)
+
+    def snapshot(self, name=None):
+        """Состояние продукта name или, если name не задан, всей загрузки."""
+        now = time.monotonic()
+        with self.lock:
+            counter = self.total if name is None else self.products[name]
+            return counter.snapshot(now)
@@ -0,0 +1,286 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from botocore.exceptions import ClientError
+
+from api.retry import get_retrier
+
+MiB = 1024 * 1024
+CHUNK_SIZE = 16 * MiB
+MULTIPART_THRESHOLD = 2 * CHUNK_SIZE
+CHUNK_CONCURRENCY = 4
+READ_BUFFER = MiB
+
+_targets_lock = threading.Lock()
+_targets = {}
+
+
+def split_ranges(size, chunk_size):
+    """Разбиение объекта размером size на диапазоны байтов [start, end] включительно."""
+    return [(start, min(start + chunk_size, size) - 1) for start in range(0, size, chunk_size)]
+
+
+def _no_progress(count, transferred=True):
+    pass
+
+
+class TokenBucket:
+    """
+    Ограничение скорости передачи: в среднем не больше rate байт/с на все потоки загрузки.
+
+    Поток, прочитавший блок, забирает из ведра его размер и, если ведро ушло в долг,
+    ждёт, пока долг покроется. Пауза в чтении ответа замедляет и саму передачу по TCP.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = burst or max(self.rate, READ_BUFFER)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consume(self, count):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= count
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+
+
+def _copy_stream(body, file, callback):
+    for data in iter(lambda: body.read(READ_BUFFER), b""):
+        file.write(data)
+        callback(len(data))
+
+
+@contextmanager
+def _target_lock(target):
+    """
+    Исключительный доступ к файлу target (и его target.part) в пределах процесса.
+
+    Задания и области наблюдения с общей папкой загрузки могут одновременно загружать один
+    и тот же объект; без блокировки они писали бы в один частичный файл. В записи блокировки
+    загрузчик отмечает (размер, ETag) загруженной версии, чтобы ожидавшие его не загружали её снова.
+    """
+    key = os.path.abspath(target)
+    with _targets_lock:
+        entry = _targets.setdefault(key, {"lock": threading.Lock(), "users": 0, "done": None})
+        entry["users"] += 1
+    try:
+        with entry["lock"]:
+            yield entry
+    finally:
+        with _targets_lock:
+            entry["users"] -= 1
+            if not entry["users"]:
+                del _targets[key]
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _precondition_failed(error):
+    return error.response.get("Error", {}).get("Code") in ("PreconditionFailed", "412")
+
+
+def _get_object(client, bucket, key, etag=None, start=None, end=None):
+    kwargs = {"Bucket": bucket, "Key": key}
+    if start is not None:
+        kwargs["Range"] = f"bytes={start}-{'' if end is None else end}"
+    if etag:
+        # Продолжение загрузки допустимо, только если объект в хранилище не изменился
+        kwargs["IfMatch"] = etag
+    return client.get_object(**kwargs)
+
+
+def _download_range(client, bucket, key, etag, part_path, start, end, callback):
+    response = _get_object(client, bucket, key, etag, start, end)
+    # Каждый диапазон пишется через свой дескриптор, поэтому потоки не делят позицию в файле
+    with open(part_path, "r+b") as file:
+        file.seek(start)
+        _copy_stream(response["Body"], file, callback)
+
+
+def _download_single(client, bucket, key, size, etag, part_path, callback):
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    if offset > size:
+        offset = 0
+    if offset:
+        callback(offset, False)
+    if offset == size and size > 0:
+        return
+    if offset:
+        response = _get_object(client, bucket, key, etag, offset)
+        mode = "ab"
+    else:
+        response = _get_object(client, bucket, key)
+        mode = "wb"
+    with open(part_path, mode) as file:
+        _copy_stream(response["Body"], file, callback)
+
+
+def _read_chunks(chunks_path, header):
+    try:
+        with open(chunks_path, encoding="utf-8") as file:
+            lines = file.read().splitlines()
+    except FileNotFoundError:
+        return None
+    if not lines or lines[0] != header:
+        return None
+    return {int(line) for line in lines[1:] if line}
+
+
+def _is_multipart(size, chunk_size, max_concurrency):
+    return size > max(MULTIPART_THRESHOLD, chunk_size) and max_concurrency > 1
+
+
+def _chunks_header(etag, size, chunk_size):
+    return f"{etag or ''} {size} {chunk_size}"
+
+
+def resumable_bytes(target, size, etag=None, chunk_size=CHUNK_SIZE, max_concurrency=CHUNK_CONCURRENCY):
+    """Сколько байтов объекта уже записано в target.part и не будет загружаться повторно."""
+    part_path = target + ".part"
+    if not os.path.exists(part_path):
+        return 0
+    part_size = os.path.getsize(part_path)
+    if not _is_multipart(size, chunk_size, max_concurrency):
+        return part_size if part_size <= size else 0
+    done = _read_chunks(part_path + ".chunks", _chunks_header(etag, size, chunk_size)) if part_size == size else None
+    if not done:
+        return 0
+    return sum(end - start + 1 for start, end in split_ranges(size, chunk_size) if start in done)
+
+
+def _download_ranges(client, bucket, key, size, etag, part_path, chunk_size, max_concurrency, callback):
+    # Рядом с частичным файлом хранится журнал загруженных диапазонов (по смещению начала)
+    chunks_path = part_path + ".chunks"
+    header = _chunks_header(etag, size, chunk_size)
+    done = None
+    if os.path.exists(part_path) and os.path.getsize(part_path) == size:
+        done = _read_chunks(chunks_path, header)
+    if done is None:
+        with open(part_path, "wb") as file:
+            file.truncate(size)
+        with open(chunks_path, "w", encoding="utf-8") as file:
+            file.write(header + "\n")
+        done = set()
+
+    lock = threading.Lock()
+
+    def fetch(start, end):
+        _download_range(client, bucket, key, etag, part_path, start, end, callback)
+        with lock, open(chunks_path, "a", encoding="utf-8") as file:
+            file.write(f"{start}\n")
+
+    ranges = []
+    for start, end in split_ranges(size, chunk_size):
+        if start in done:
+            callback(end - start + 1, False)
+        else:
+            ranges.append((start, end))
+    with ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="s3-range") as executor:
+        futures = [executor.submit(fetch, start, end) for start, end in ranges]
+        for future in futures:
+            future.result()
+
+
+def download_object(
+    client,
+    bucket,
+    key,
+    size,
+    target,
+    chunk_size=CHUNK_SIZE,
+    max_concurrency=CHUNK_CONCURRENCY,
+    etag=None,
+    callback=_no_progress,
+    bandwidth=None,
+):
+    """
+    Загрузка объекта S3 в файл target с продолжением прерванной загрузки.
+
+    Объекты больше MULTIPART_THRESHOLD делятся на диапазоны по chunk_size байт, которые
+    загружаются параллельно в max_concurrency потоков и пишутся сразу на свои смещения в
+    заранее размеченный файл, без буферизации объекта в памяти. Данные пишутся во временный
+    файл target.part, который переименовывается в target только после загрузки всех частей.
+    Если target.part остался от прерванной загрузки, догружаются только недостающие байты
+    (или диапазоны); при изменении объекта в хранилище (другой ETag) загрузка начинается заново.
+    О каждом записанном блоке сообщается вызовом callback(count); байты, уже загруженные
+    ранее, сообщаются как callback(count, False). При временной ошибке загрузка повторяется
+    общим Retrier хранилища и продолжается с уже записанных байтов; учтённые неудачной
+    попыткой байты перед повтором вычитаются вызовом callback(-count, False).
+    Если передан bandwidth (TokenBucket), скорость чтения ответов ограничивается им.
+    Одновременные загрузки одного target в процессе выполняются по очереди (_target_lock).
+    """
+    with _target_lock(target) as entry:
+        if entry["done"] == (size, etag) and os.path.isfile(target) and os.path.getsize(target) == size:
+            # Эту же версию объекта только что загрузил другой загрузчик
+            callback(size, False)
+            return
+        _download_to(client, bucket, key, size, target, chunk_size, max_concurrency, etag, callback, bandwidth)
+        entry["done"] = (size, etag)
+
+
+def _download_to(client, bucket, key, size, target, chunk_size, max_concurrency, etag, callback, bandwidth):
+    part_path = target + ".part"
+    reported = [0]
+    lock = threading.Lock()
+
+    def counting_callback(count, transferred=True):
+        with lock:
+            reported[0] += count
+        callback(count, transferred)
+        if bandwidth is not None and transferred and count > 0:
+            bandwidth.consume(count)
+
+    def rollback(error):
+        with lock:
+            count, reported[0] = reported[0], 0
+        callback(-count, False)
+
+    get_retrier("s3").call(
+        _download_object,
+        client,
+        bucket,
+        key,
+        size,
+        part_path,
+        chunk_size,
+        max_concurrency,
+        etag,
+        counting_callback,
+        rollback,
+        before_retry=rollback,
+    )
+    os.replace(part_path, target)
+    _remove(part_path + ".chunks")
+
+
+def _download_object(client, bucket, key, size, part_path, chunk_size, max_concurrency, etag, callback, rollback):
+    multipart = _is_multipart(size, chunk_size, max_concurrency)
+
+    for attempt in range(2):
+        try:
+            if multipart:
+                _download_ranges(client, bucket, key, size, etag, part_path, chunk_size, max_concurrency, callback)
+            else:
+                _download_single(client, bucket, key, size, etag, part_path, callback)
+            break
+        except ClientError as e:
+            if attempt or not _precondition_failed(e):
+                raise
+            # Объект изменился: байты частичного файла, уже учтённые в прогрессе, загрузятся заново
+            rollback(e)
+            _remove(part_path)
+            _remove(part_path + ".chunks")
@@ -0,0 +1,69 @@
+import os
+import threading
+
+import boto3
+import requests
+from botocore.config import Config
+from requests.adapters import HTTPAdapter
+
+from api.retry import get_retrier
+
+# Адреса можно переопределить переменными окружения, например для локальных заглушек в benchmarks
+ENDPOINT_URL = os.environ.get("CDSE_S3_ENDPOINT", "https://eodata.dataspace.copernicus.eu/")
+CATALOGUE_URL = os.environ.get("CDSE_CATALOGUE_URL", "https://catalogue.dataspace.copernicus.eu/odata/v1/Products")
+BUCKET = "eodata"
+POOL_SIZE = 10
+
+_lock = threading.Lock()
+_s3_clients = {}
+_http_session = None
+
+
+def get_s3_client(access_key, secret_key, pool_size=POOL_SIZE):
+    """
+    Общий клиент S3 для пары ключей доступа.
+
+    Клиент boto3 потокобезопасен и держит пул keep-alive соединений с ENDPOINT_URL,
+    поэтому создаётся один раз на набор учётных данных. Если запрошен пул больше
+    существующего (выросла параллельность загрузки), клиент пересоздаётся.
+    """
+    with _lock:
+        client, size = _s3_clients.get((access_key, secret_key), (None, 0))
+        if client is None or size < pool_size:
+            # boto3.session.Session создаётся явно: сессия по умолчанию не потокобезопасна
+            session = boto3.session.Session(aws_access_key_id=access_key, aws_secret_access_key=secret_key)
+            client = session.client(
+                service_name="s3",
+                endpoint_url=ENDPOINT_URL,
+                # Повторы выполняет общий Retrier, поэтому собственные повторы botocore отключены
+                config=Config(
+                    max_pool_connections=pool_size, tcp_keepalive=True, retries={"total_max_attempts": 1}
+                ),
+            )
+            _s3_clients[(access_key, secret_key)] = (client, pool_size)
+        return client
+
+
+def get_http_session(pool_size=POOL_SIZE):
+    """Общая keep-alive сессия requests для запросов к каталогу OData."""
+    global _http_session
+    with _lock:
+        if _http_session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _http_session = session
+        return _http_session
+
+
+def list_objects(client, prefix, bucket=BUCKET):
+    """Список объектов S3 с префиксом prefix (словари с ключами Key, Size, ETag)."""
+
+    def list_all():
+        objects = []
+        for page in client.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=prefix):
+            objects.extend(page.get("Contents", []))
+        return objects
+
+    return get_retrier("s3").call(list_all)
@@ -0,0 +1,281 @@
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from api.catalogue import format_time, parse_time, query_interval, utc_now
+from api.cloud_screening import CloudScreener
+from api.dataspace_api import (
+    LIST_WORKERS,
+    MAX_WORKERS,
+    DownloadPipeline,
+    get_tile_list,
+    iter_selected_products,
+    make_path,
+)
+from api.instrumentation import RunStats
+from api.integrity import ProductVerifier
+from api.local_index import ProductIndex
+from api.query_cache import query_key
+from api.reporting import Reporter
+from api.shared import SQLiteDatabase
+from api.transfer import CHUNK_CONCURRENCY, CHUNK_SIZE
+from api.transport import get_s3_client
+
+STATE_PATH = os.path.join(os.path.expanduser("~"), ".sentinel2_downloader", "watch.sqlite")
+WATCH_INTERVAL = 3600
+WATCH_JITTER = 0.1
+WATCH_WORKERS = 4
+# Продукт публикуется позже съёмки, поэтому после первого опроса даты съёмки ищутся
+# только в этом окне перед отметкой публикации
+WATCH_LOOKBACK = timedelta(days=30)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS marks (
+    name TEXT PRIMARY KEY,
+    query TEXT NOT NULL,
+    published TEXT,
+    polled REAL NOT NULL
+);
+"""
+
+
+class WatchState(SQLiteDatabase):
+    """
+    Отметки наблюдения в SQLite: для каждой области интересов — дата публикации последнего
+    обработанного продукта. Если параметры запроса области изменились, отметка сбрасывается.
+    """
+
+    def __init__(self, path=STATE_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        super().__init__(path, SCHEMA)
+
+    def published(self, name, key):
+        with self.lock:
+            row = self.connection.execute("SELECT query, published FROM marks WHERE name = ?", (name,)).fetchone()
+        if row is None or row[0] != key:
+            return None
+        return row[1]
+
+    def update(self, name, key, published):
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO marks (name, query, published, polled) VALUES (?, ?, ?, ?)",
+                (name, key, published, time.time()),
+            )
+
+
+class WatchTarget:
+    """
+    Наблюдаемая область интересов: запрос qp (с готовыми контурами footprint), слой области
+    input_shapefile, папка загрузки и параметры отбора продуктов. Тайлы области вычисляются
+    один раз и используются во всех опросах.
+    """
+
+    def __init__(
+        self,
+        name,
+        qp,
+        input_shapefile,
+        target_directory,
+        selection=None,
+        product_policy=None,
+        aoi_cloud_percentage=None,
+        reporter=None,
+    ):
+        self.name = name
+        self.qp = qp
+        self.input_shapefile = input_shapefile
+        self.target_directory = target_directory
+        self.selection = selection
+        self.product_policy = product_policy
+        self.aoi_cloud_percentage = aoi_cloud_percentage
+        self.reporter = reporter or Reporter()
+        self.key = query_key(qp, product_policy == "cloud")
+        self._zones = None
+
+    def zones(self, satellite_grid):
+        if self._zones is None:
+            self._zones = set(get_tile_list(satellite_grid, self.input_shapefile))
+        return self._zones
+
+
+class Watcher:
+    """
+    Периодический опрос каталога для многих областей интересов.
+
+    Каждая область опрашивается раз в interval секунд со случайным отклонением до jitter·interval,
+    чтобы опросы сотен областей не совпадали по времени. После первого опроса в каталоге
+    запрашиваются только продукты, опубликованные позже отметки области (WatchState), и новые
+    продукты сразу передаются в DownloadPipeline. Отметка сдвигается, только если загрузка
+    завершилась без ошибок. Одновременно опрашивается не более workers областей; семафор
+    download_slots ограничивает число одновременных загрузок объектов во всех областях.
+    Время стадий и счётчики всех опросов собираются в stats (RunStats). close() останавливает
+    и идущие загрузки: начатые объекты дозагружаются, остальные ждут следующего запуска.
+    """
+
+    def __init__(
+        self,
+        access_key,
+        secret_key,
+        satellite_grid,
+        targets,
+        interval=WATCH_INTERVAL,
+        jitter=WATCH_JITTER,
+        workers=WATCH_WORKERS,
+        max_workers=MAX_WORKERS,
+        chunk_size=CHUNK_SIZE,
+        chunk_concurrency=CHUNK_CONCURRENCY,
+        list_workers=LIST_WORKERS,
+        download_slots=None,
+        state_path=STATE_PATH,
+        verify=True,
+        stats=None,
+    ):
+        self.client = get_s3_client(access_key, secret_key, pool_size=max_workers * chunk_concurrency + list_workers)
+        self.satellite_grid = satellite_grid
+        self.targets = targets
+        self.interval = interval
+        self.jitter = jitter
+        self.workers = workers
+        self.max_workers = max_workers
+        self.list_workers = list_workers
+        self.transfer = {"chunk_size": chunk_size, "chunk_concurrency": chunk_concurrency}
+        self.download_slots = download_slots
+        self.verify = verify
+        self.stats = stats or RunStats()
+        self.state = WatchState(state_path)
+        self.stop = threading.Event()
+        # Идущие конвейеры загрузки, которые останавливает close()
+        self.pipelines = set()
+        self.condition = threading.Condition()
+        self.schedule = []
+        self.counter = itertools.count()
+
+    def _delay(self):
+        return self.interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def _plan(self, target, due):
+        with self.condition:
+            heapq.heappush(self.schedule, (due, next(self.counter), target))
+            self.condition.notify()
+
+    def run(self):
+        """Опрашивать области до вызова close()."""
+        now = time.monotonic()
+        for target in self.targets:
+            # Первые опросы распределяются по интервалу jitter·interval
+            self._plan(target, now + random.uniform(0, self.interval * self.jitter))
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="watch") as executor:
+            while not self.stop.is_set():
+                with self.condition:
+                    while not self.stop.is_set() and (not self.schedule or self.schedule[0][0] > time.monotonic()):
+                        timeout = self.schedule[0][0] - time.monotonic() if self.schedule else None
+                        self.condition.wait(timeout)
+                    if self.stop.is_set():
+                        break
+                    _, _, target = heapq.heappop(self.schedule)
+                executor.submit(self._poll_and_plan, target)
+        self.state.close()
+
+    def close(self):
+        with self.condition:
+            self.stop.set()
+            for pipeline in self.pipelines:
+                pipeline.stop.set()
+            self.condition.notify_all()
+
+    def _poll_and_plan(self, target):
+        try:
+            self.poll(target)
+        except Exception as e:
+            print(f"Ошибка опроса области {target.name}: {e}")
+        finally:
+            # Следующий опрос планируется после окончания текущего, поэтому опросы одной области не пересекаются
+            if not self.stop.is_set():
+                self._plan(target, time.monotonic() + self._delay())
+
+    def poll(self, target):
+        """Один опрос области: поиск продуктов новее отметки и их загрузка."""
+        if self.stop.is_set():
+            return
+        published = self.state.published(target.name, target.key)
+        polled = utc_now()
+        qp = dict(target.qp, time_end=format_time(polled))
+        if published:
+            start = parse_time(query_interval(qp)[0])
+            qp["time_start"] = format_time(max(start, parse_time(published) - WATCH_LOOKBACK))
+            qp["published_after"] = published
+
+        with self.stats.stage("tile_selection"):
+            zones = target.zones(self.satellite_grid)
+        products = iter_selected_products(qp, zones, target.product_policy, stats=self.stats)
+        first = next(products, None)
+        if first is None:
+            # Отметка сдвигается и без новых продуктов, иначе каждый следующий опрос области
+            # искал бы заново всю историю от date_start; запас WATCH_LOOKBACK покрывает продукты,
+            # которые появятся в каталоге с датой публикации раньше этого опроса
+            floor = polled - WATCH_LOOKBACK
+            if not published or parse_time(published) < floor:
+                published = format_time(floor)
+            self.state.update(target.name, target.key, published)
+            return
+        print(f"Область {target.name}: найдены новые продукты")
+
+        latest = {"published": published or ""}
+
+        def s3_paths():
+            for product in itertools.chain([first], products):
+                latest["published"] = max(latest["published"], product.get("PublicationDate") or "")
+                yield product["S3Path"]
+
+        make_path(target.target_directory)
+        index = ProductIndex(target.target_directory)
+        screener = None
+        if target.aoi_cloud_percentage is not None:
+            screener = CloudScreener(
+                self.client, target.input_shapefile, target.aoi_cloud_percentage, target.target_directory
+            )
+        verifier = ProductVerifier(self.client, target.target_directory) if self.verify else None
+        try:
+            pipeline = DownloadPipeline(
+                self.client,
+                index,
+                target.target_directory,
+                target.reporter,
+                selection=target.selection,
+                screener=screener,
+                max_workers=self.max_workers,
+                list_workers=self.list_workers,
+                transfer=self.transfer,
+                download_slots=self.download_slots,
+                verifier=verifier,
+                stats=self.stats,
+            )
+            with self.condition:
+                if self.stop.is_set():
+                    return
+                self.pipelines.add(pipeline)
+            try:
+                pipeline.run(s3_paths())
+            finally:
+                with self.condition:
+                    self.pipelines.discard(pipeline)
+        finally:
+            if screener is not None:
+                screener.close()
+            if verifier is not None:
+                verifier.close()
+            index.close()
+        if self.stop.is_set():
+            # Загрузка прервана: продукты, до которых она не дошла, должны быть найдены снова
+            return
+        if pipeline.failed:
+            # Отметка не сдвигается: при следующем опросе неудавшиеся продукты будут найдены снова
+            return
+        self.state.update(target.name, target.key, latest["published"] or published)
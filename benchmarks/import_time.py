@@ -0,0 +1,115 @@
+"""
+Проверка времени импорта при запуске приложения.
+
+    python -m benchmarks.import_time                 # импорт main (окно интерфейса)
+    python -m benchmarks.import_time --module cli --budget 3000 --allow-heavy
+
+Модуль импортируется в отдельном процессе с python -X importtime несколько раз, для каждого
+модуля берётся наименьшее время. Выводятся самые затратные модули; проверка не проходит, если
+общее время превышает --budget или при запуске импортируется тяжёлый модуль из DEFERRED,
+который должен загружаться лениво, уже после появления окна.
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUDGET_MS = 1000
+REPEAT = 3
+TOP = 20
+# Модули, которые не должны импортироваться до появления окна (загружаются в фоне gui.gui.warm_up)
+DEFERRED = ("geopandas", "shapely", "numpy", "pandas", "pyproj", "boto3", "botocore", "requests", "fp")
+
+LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|( *)(\S+)")
+
+
+def measure(module):
+    """Время импорта module по модулям: {имя: (собственное, суммарное, вложенность)} в микросекундах."""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1])
+    timings = {}
+    for line in completed.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            timings[match[4]] = (int(match[1]), int(match[2]), (len(match[3]) - 1) // 2)
+    return timings
+
+
+def best_of(module, repeat):
+    """Наименьшие за repeat запусков времена импорта каждого модуля."""
+    best = {}
+    for _ in range(repeat):
+        for name, (own, cumulative, depth) in measure(module).items():
+            if name not in best or cumulative < best[name][1]:
+                best[name] = (own, cumulative, depth)
+    return best
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Проверка времени импорта при запуске.")
+    parser.add_argument("--module", default="main", help="импортируемый модуль (по умолчанию main)")
+    parser.add_argument("--budget", type=float, default=BUDGET_MS, help="допустимое время импорта, мс")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="число замеров")
+    parser.add_argument("--top", type=int, default=TOP, help="сколько самых затратных модулей показать")
+    parser.add_argument("--allow-heavy", action="store_true", help="не проверять ленивую загрузку DEFERRED")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    arguments = parse_arguments(argv)
+    try:
+        timings = best_of(arguments.module, arguments.repeat)
+    except RuntimeError as e:
+        print(f"Не удалось импортировать {arguments.module}: {e}", file=sys.stderr)
+        return 2
+
+    total = timings[arguments.module][1] / 1000
+    print(f"Импорт {arguments.module}: {total:.0f} мс (бюджет {arguments.budget:.0f} мс)")
+    print("Пакеты верхнего уровня по суммарному времени:")
+    top_level = [(name, cumulative) for name, (_, cumulative, depth) in timings.items() if depth == 0]
+    for name, cumulative in sorted(top_level, key=lambda item: item[1], reverse=True)[: arguments.top]:
+        print(f"  {cumulative / 1000:8.1f} мс  {name}")
+    print("Модули по собственному времени:")
+    for name, (own, _, _) in sorted(timings.items(), key=lambda item: item[1][0], reverse=True)[: arguments.top]:
+        print(f"  {own / 1000:8.1f} мс  {name}")
+
+    failed = total > arguments.budget
+    if failed:
+        print(f"Время импорта превышает бюджет на {total - arguments.budget:.0f} мс")
+    if not arguments.allow_heavy:
+        eager = [name for name in DEFERRED if name in timings]
+        if eager:
+            failed = True
+            print(f"При запуске импортируются модули, которые должны загружаться лениво: {', '.join(eager)}")
+            for name in eager:
+                chain = _importers(timings, name)
+                print(f"  {name}: {' <- '.join(chain)}")
+    return 1 if failed else 0
+
+
+def _importers(timings, name):
+    """Цепочка модулей, из-за которых импортирован name (по порядку и вложенности -X importtime)."""
+    names = list(timings)
+    position = names.index(name)
+    chain = [name]
+    depth = timings[name][2]
+    # Родитель в выводе -X importtime — первый следующий модуль с меньшей вложенностью
+    for other in names[position + 1 :]:
+        if timings[other][2] < depth:
+            chain.append(other)
+            depth = timings[other][2]
+    return chain
+
+
+if __name__ == "__main__":
+    sys.exit(main())
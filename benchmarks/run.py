@@ -0,0 +1,283 @@
+"""
+Офлайн-замеры поиска и загрузки на локальных заглушках S3 и каталога OData.
+
+    python -m benchmarks.run                         # все сценарии, сравнение с baseline.json
+    python -m benchmarks.run search download --products 200 --latency 20 --error-rate 0.01
+    python -m benchmarks.run --save-baseline         # сохранить результаты как базовые
+
+Каждый сценарий выполняется в отдельном процессе, поэтому процессорное время и пиковый
+объём памяти (RSS) относятся только к нему. Заглушки работают в процессе запуска.
+
+Базовые результаты зависят от машины, поэтому baseline.json не хранится в репозитории:
+перед изменением сохраните их на своей машине запуском с --save-baseline на исходной
+версии кода, затем запускайте замеры без этого флага на изменённой.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import traceback
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+KiB = 1024
+
+AOI = [27.3, 53.7, 27.8, 54.0]
+LARGE_AOI = [20.0, 45.0, 40.0, 60.0]
+
+# Параметры сценариев: число продуктов и объектов, размер объектов, интервал дат в сутках
+SCENARIOS = {
+    "tile_selection": {"iterations": 20},
+    "search": {"products": 1000, "objects_per_product": 0, "object_size": 0, "days": 365},
+    "download": {"products": 100, "objects_per_product": 8, "object_size": 128 * KiB, "days": 60},
+    "resume": {"products": 20, "objects_per_product": 8, "object_size": 512 * KiB, "days": 30},
+    "repair": {"products": 10, "objects_per_product": 8, "object_size": 256 * KiB, "days": 30},
+}
+# Подготовительные шаги сценариев; запросы к заглушкам во время подготовки не учитываются
+PREPARE = {"resume": "resume_prepare", "repair": "repair_prepare"}
+# Для этих показателей лучше большее значение, для остальных — меньшее
+HIGHER_IS_BETTER = ("throughput",)
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(round(fraction * (len(values) - 1))), len(values) - 1)]
+
+
+def run_child(name, config, workdir, environment, verbose):
+    """Выполнить сценарий name в отдельном процессе и вернуть его результат."""
+    command = [sys.executable, "-m", "benchmarks.run", "--child", name, "--child-config", json.dumps(config)]
+    completed = subprocess.run(
+        command,
+        cwd=ROOT,
+        env=dict(os.environ, **environment, BENCHMARK_WORKDIR=workdir),
+        stdout=subprocess.PIPE,
+        stderr=None if verbose else subprocess.DEVNULL,
+        text=True,
+        check=True,
+    )
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def child_main(name, config):
+    """Точка входа процесса сценария: результат печатается последней строкой stdout в JSON."""
+    from benchmarks.scenarios import SCENARIOS as FUNCTIONS
+
+    output = sys.stdout
+    # Журнал загрузки не должен смешиваться с результатом
+    sys.stdout = sys.stderr
+    result = FUNCTIONS[name](config, os.environ["BENCHMARK_WORKDIR"])
+    result["peak_rss"] = peak_rss()
+    output.write(json.dumps(result) + "\n")
+
+
+def peak_rss():
+    """Пиковый объём памяти (RSS) текущего процесса в байтах."""
+    if sys.platform == "win32":
+        # Модуля resource в Windows нет: пиковый рабочий набор даёт GetProcessMemoryInfo
+        import ctypes
+        from ctypes import wintypes
+
+        class Counters(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD)] + [
+                (name, ctypes.c_size_t)
+                for name in (
+                    "PeakWorkingSetSize",
+                    "WorkingSetSize",
+                    "QuotaPeakPagedPoolUsage",
+                    "QuotaPagedPoolUsage",
+                    "QuotaPeakNonPagedPoolUsage",
+                    "QuotaNonPagedPoolUsage",
+                    "PagefileUsage",
+                    "PeakPagefileUsage",
+                )
+            ]
+
+        kernel32 = ctypes.WinDLL("kernel32")
+        psapi = ctypes.WinDLL("psapi")
+        kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+        psapi.GetProcessMemoryInfo.argtypes = [wintypes.HANDLE, ctypes.POINTER(Counters), wintypes.DWORD]
+        counters = Counters(cb=ctypes.sizeof(Counters))
+        psapi.GetProcessMemoryInfo(kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb)
+        return counters.PeakWorkingSetSize
+
+    import resource
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    # ru_maxrss — в килобайтах в Linux и в байтах в macOS
+    return usage.ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+
+def scenario_tiles(aoi):
+    import geopandas as gpd
+    from shapely.geometry import box
+
+    from api.dataspace_api import get_tile_list
+    from api.grid import get_grid
+
+    return get_tile_list(get_grid(), gpd.GeoDataFrame(geometry=[box(*aoi)], crs="EPSG:4326"))
+
+
+def run_scenario(name, parameters, arguments):
+    """Подготовить данные и заглушки, выполнить сценарий и вычислить показатели."""
+    from benchmarks.servers import CatalogueStubServer, Faults, RequestLog, S3StubServer
+    from benchmarks.synthetic import SyntheticCatalogue, default_range
+
+    config = {"aoi": AOI, "large_aoi": LARGE_AOI, "verify": not arguments.no_verify, **parameters}
+    workdir = tempfile.mkdtemp(prefix=f"benchmark-{name}-")
+    try:
+        if name == "tile_selection":
+            result = run_child(name, config, workdir, {}, arguments.verbose)
+            latencies = result["latencies"]
+            return metrics(result, latencies, result["operations"], "операций/с")
+
+        start, end = default_range(parameters["days"])
+        tiles = scenario_tiles(AOI)
+        catalogue = SyntheticCatalogue(
+            tiles,
+            parameters["products"],
+            start,
+            end,
+            parameters["objects_per_product"],
+            parameters["object_size"],
+            seed=arguments.seed,
+        )
+        config.update(tiles=tiles, date_start=f"{start:%Y-%m-%d}", date_end=f"{end:%Y-%m-%d}")
+        log = RequestLog()
+        faults = Faults(arguments.latency / 1000, arguments.error_rate, arguments.seed)
+        with S3StubServer(catalogue, faults, log) as s3, CatalogueStubServer(catalogue, faults, log) as odata:
+            environment = {"CDSE_S3_ENDPOINT": s3.url, "CDSE_CATALOGUE_URL": odata.url}
+            prepared = {}
+            if name in PREPARE:
+                prepared = run_child(PREPARE[name], config, workdir, environment, arguments.verbose)
+                log.reset()
+            result = run_child(name, config, workdir, environment, arguments.verbose)
+            served = log.snapshot()
+
+        if name == "repair" and len(served["durations"].get("s3_get", [])) < prepared["corrupted"]:
+            raise RuntimeError("Повреждённые объекты не запрошены из хранилища повторно")
+
+        if name == "search":
+            latencies = served["durations"].get("search", [])
+            return metrics(result, latencies, result["operations"], "продуктов/с", served)
+        latencies = served["durations"].get("s3_get", [])
+        transferred = result.get("bytes", prepared.get("remaining", 0))
+        return metrics(result, latencies, transferred / 1024 / 1024, "МБ/с", served)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def metrics(result, latencies, amount, unit, served=None):
+    wall = max(result["wall"], 1e-9)
+    return {
+        "wall_time": round(wall, 4),
+        "cpu_time": round(result["cpu"], 4),
+        "throughput": round(amount / wall, 3),
+        "throughput_unit": unit,
+        "p50_ms": None if not latencies else round(percentile(latencies, 0.5) * 1000, 3),
+        "p99_ms": None if not latencies else round(percentile(latencies, 0.99) * 1000, 3),
+        "peak_rss_mb": round(result["peak_rss"] / 1024 / 1024, 1),
+        "operations": result["operations"],
+        "injected_errors": 0 if served is None else served["errors"],
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Строки отчёта и список ухудшений больше tolerance относительно baseline."""
+    lines = []
+    regressions = []
+    for name, values in results.items():
+        lines.append(f"{name}:")
+        for metric, value in values.items():
+            if metric in ("throughput_unit", "operations", "injected_errors") or value is None:
+                if metric in ("operations", "injected_errors"):
+                    lines.append(f"  {metric:<16}{value}")
+                continue
+            unit = f" {values['throughput_unit']}" if metric == "throughput" else ""
+            reference = baseline.get(name, {}).get(metric)
+            if not reference:
+                lines.append(f"  {metric:<16}{value}{unit}")
+                continue
+            change = (value - reference) / reference
+            worse = -change if metric in HIGHER_IS_BETTER else change
+            mark = ""
+            if worse > tolerance:
+                mark = "  <- ухудшение"
+                regressions.append((name, metric, reference, value))
+            lines.append(f"  {metric:<16}{value}{unit} (база {reference}, {change:+.1%}){mark}")
+    return lines, regressions
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Офлайн-замеры поиска и загрузки Sentinel-2.")
+    parser.add_argument("scenarios", nargs="*", help=f"сценарии: {', '.join(SCENARIOS)} (по умолчанию все)")
+    parser.add_argument("--products", type=int, help="число продуктов в каталоге")
+    parser.add_argument("--objects", type=int, help="число объектов в продукте (без manifest.safe)")
+    parser.add_argument("--object-size", type=int, help="средний размер объекта, байт")
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка каждого ответа заглушек, мс")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 503 SlowDown")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-verify", action="store_true", help="не проверять загруженные объекты")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="файл базовых результатов")
+    parser.add_argument("--save-baseline", action="store_true", help="сохранить результаты как базовые")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="допустимое ухудшение, доля")
+    parser.add_argument("--verbose", action="store_true", help="показывать журнал процессов сценариев")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--child-config", help=argparse.SUPPRESS)
+    arguments = parser.parse_args(argv)
+    unknown = [name for name in arguments.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"неизвестные сценарии: {', '.join(unknown)}")
+    return arguments
+
+
+def main(argv=None):
+    arguments = parse_arguments(argv)
+    if arguments.child:
+        child_main(arguments.child, json.loads(arguments.child_config))
+        return 0
+
+    results = {}
+    for name in arguments.scenarios or list(SCENARIOS):
+        parameters = dict(SCENARIOS[name])
+        overrides = {
+            "products": arguments.products,
+            "objects_per_product": arguments.objects,
+            "object_size": arguments.object_size,
+        }
+        parameters.update({key: value for key, value in overrides.items() if key in parameters and value is not None})
+        print(f"Сценарий {name}...", file=sys.stderr)
+        try:
+            results[name] = run_scenario(name, parameters, arguments)
+        except Exception:
+            traceback.print_exc()
+            print(f"Сценарий {name} завершился ошибкой", file=sys.stderr)
+
+    baseline = {}
+    if os.path.exists(arguments.baseline):
+        with open(arguments.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)
+    elif not arguments.save_baseline:
+        print(f"Файл {arguments.baseline} не найден, сравнения нет: сохраните базу запуском с --save-baseline")
+    lines, regressions = compare(results, baseline, arguments.tolerance)
+    print("\n".join(lines))
+
+    if arguments.save_baseline:
+        with open(arguments.baseline, "w", encoding="utf-8") as file:
+            json.dump(dict(baseline, **results), file, ensure_ascii=False, indent=2)
+        print(f"Базовые результаты сохранены в {arguments.baseline}")
+        return 0
+    if regressions:
+        print(f"Ухудшений больше {arguments.tolerance:.0%}: {len(regressions)}")
+        return 1
+    return 0 if len(results) == len(arguments.scenarios or SCENARIOS) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,203 @@
+import os
+import time
+
+import geopandas as gpd
+from shapely.geometry import box
+
+from api import proxy_pool
+from api.catalogue import build_footprints
+from api.dataspace_api import download_sentinel_images, get_tile_list, iter_catalogue_products
+from api.grid import get_grid
+from api.integrity import MANIFEST_NAME, verify_index
+from api.local_index import ProductIndex
+from api.proxy_pool import ProxyPool
+
+ACCESS_KEY = "benchmark"
+SECRET_KEY = "benchmark"
+
+
+def aoi_frame(bounds):
+    return gpd.GeoDataFrame(geometry=[box(*bounds)], crs="EPSG:4326")
+
+
+def query_parameters(config):
+    return {
+        "setillite": "SENTINEL-2",
+        "producttype": "S2MSI2A",
+        "cloud_percentage": 100,
+        "footprint": build_footprints(aoi_frame(config["aoi"]).geometry.unary_union),
+        "date_start": config["date_start"],
+        "date_end": config["date_end"],
+    }
+
+
+def use_direct_connection(workdir):
+    """Запросы к заглушкам идут напрямую: без общедоступных прокси и без общей статистики пула."""
+    proxy_pool._pool.value = ProxyPool(path=os.path.join(workdir, "proxies.json"), source=list)
+
+
+class Measurement:
+    """Время и процессорное время замеряемого участка сценария."""
+
+    def __enter__(self):
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.wall = time.perf_counter() - self.wall
+        self.cpu = time.process_time() - self.cpu
+
+
+def tile_selection(config, workdir):
+    """Выбор тайлов для большой области интересов, iterations раз."""
+    grid = get_grid()
+    aoi = aoi_frame(config["large_aoi"])
+    get_tile_list(grid, aoi)
+    latencies = []
+    with Measurement() as measurement:
+        for _ in range(config["iterations"]):
+            started = time.perf_counter()
+            tiles = get_tile_list(grid, aoi)
+            latencies.append(time.perf_counter() - started)
+    return {
+        "wall": measurement.wall,
+        "cpu": measurement.cpu,
+        "operations": len(latencies),
+        "latencies": latencies,
+        "tiles": len(tiles),
+    }
+
+
+def search(config, workdir):
+    """Потоковый поиск всех продуктов области интересов в каталоге-заглушке."""
+    use_direct_connection(workdir)
+    qp = query_parameters(config)
+    with Measurement() as measurement:
+        found = sum(1 for _ in iter_catalogue_products(qp, set(config["tiles"])))
+    return {"wall": measurement.wall, "cpu": measurement.cpu, "operations": found}
+
+
+def _download(config, workdir):
+    return download_sentinel_images(
+        ACCESS_KEY,
+        SECRET_KEY,
+        query_parameters(config),
+        get_grid(),
+        aoi_frame(config["aoi"]),
+        os.path.join(workdir, "download"),
+        use_query_cache=False,
+        verify=config["verify"],
+    )
+
+
+def _downloaded_bytes(workdir):
+    return sum(
+        os.path.getsize(os.path.join(path, name))
+        for path, _, names in os.walk(os.path.join(workdir, "download"))
+        for name in names
+        if not name.startswith(".sentinel2_index")
+    )
+
+
+def download(config, workdir):
+    """Загрузка всех продуктов области интересов в пустую папку."""
+    use_direct_connection(workdir)
+    get_grid()
+    with Measurement() as measurement:
+        products = _download(config, workdir)
+    return {
+        "wall": measurement.wall,
+        "cpu": measurement.cpu,
+        "operations": len(products),
+        "bytes": _downloaded_bytes(workdir),
+    }
+
+
+def resume_prepare(config, workdir):
+    """
+    Подготовка продолжения: полная загрузка, затем имитация прерывания — у половины объектов
+    каждого продукта файл обрезается до половины и переименовывается в .part, а сами объекты
+    отмечаются в индексе незагруженными.
+    """
+    use_direct_connection(workdir)
+    _download(config, workdir)
+    target = os.path.join(workdir, "download")
+    index = ProductIndex(target)
+    remaining = 0
+    try:
+        for s3path in index.complete_products():
+            objects = index.product_objects(s3path)
+            interrupted = [obj for number, obj in enumerate(objects) if number % 2 == 0]
+            for obj in interrupted:
+                path = os.path.join(target, obj["Key"])
+                os.replace(path, path + ".part")
+                with open(path + ".part", "r+b") as file:
+                    file.truncate(obj["Size"] // 2)
+                remaining += obj["Size"] - obj["Size"] // 2
+            index.invalidate(s3path, [obj["Key"] for obj in interrupted])
+    finally:
+        index.close()
+    return {"remaining": remaining}
+
+
+def resume(config, workdir):
+    """Продолжение прерванной загрузки, подготовленной resume_prepare."""
+    use_direct_connection(workdir)
+    get_grid()
+    with Measurement() as measurement:
+        products = _download(config, workdir)
+    return {"wall": measurement.wall, "cpu": measurement.cpu, "operations": len(products)}
+
+
+def repair_prepare(config, workdir):
+    """
+    Подготовка восстановления: полная загрузка, затем в одном объекте каждого продукта
+    меняется байт (размер файла не меняется) и индекс проверяется verify_index.
+    """
+    use_direct_connection(workdir)
+    _download(config, workdir)
+    target = os.path.join(workdir, "download")
+    index = ProductIndex(target)
+    remaining = 0
+    try:
+        for s3path in index.complete_products():
+            obj = next(obj for obj in index.product_objects(s3path) if not obj["Key"].endswith(MANIFEST_NAME))
+            with open(os.path.join(target, obj["Key"]), "r+b") as file:
+                byte = file.read(1)
+                file.seek(0)
+                file.write(bytes([byte[0] ^ 0xFF]))
+            remaining += obj["Size"]
+        checked, corrupted = verify_index(index)
+    finally:
+        index.close()
+    if not corrupted:
+        raise RuntimeError("verify_index не нашёл повреждённых объектов")
+    return {"remaining": remaining, "corrupted": corrupted}
+
+
+def repair(config, workdir):
+    """Повторная загрузка после verify_index: повреждённые объекты должны быть загружены заново."""
+    use_direct_connection(workdir)
+    get_grid()
+    with Measurement() as measurement:
+        products = _download(config, workdir)
+    index = ProductIndex(os.path.join(workdir, "download"))
+    try:
+        checked, corrupted = verify_index(index)
+    finally:
+        index.close()
+    if corrupted:
+        raise RuntimeError(f"Повреждённые объекты не загружены заново: {corrupted}")
+    return {"wall": measurement.wall, "cpu": measurement.cpu, "operations": len(products)}
+
+
+SCENARIOS = {
+    "tile_selection": tile_selection,
+    "search": search,
+    "download": download,
+    "resume_prepare": resume_prepare,
+    "resume": resume,
+    "repair_prepare": repair_prepare,
+    "repair": repair,
+}
@@ -0,0 +1,262 @@
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlencode, urlsplit
+from xml.sax.saxutils import escape
+
+LAST_MODIFIED = "Mon, 01 Jan 2024 00:00:00 GMT"
+MAX_KEYS = 1000
+WRITE_BUFFER = 256 * 1024
+
+
+class Faults:
+    """
+    Внедряемые задержки и ошибки: latency секунд перед каждым ответом и доля error_rate
+    ответов 503 (ограничение скорости) с заголовком Retry-After. Случайность воспроизводима (seed).
+    """
+
+    def __init__(self, latency=0.0, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def inject(self):
+        """Выдержать задержку и вернуть True, если на этот запрос нужно ответить ошибкой."""
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            return self.random.random() < self.error_rate
+
+
+class RequestLog:
+    """Длительности обработки запросов заглушкой по видам запросов и число отданных байтов."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.durations = {}
+        self.bytes_sent = 0
+        self.errors = 0
+
+    def record(self, kind, duration, sent=0, error=False):
+        with self.lock:
+            self.durations.setdefault(kind, []).append(duration)
+            self.bytes_sent += sent
+            self.errors += int(error)
+
+    def reset(self):
+        with self.lock:
+            self.durations = {}
+            self.bytes_sent = 0
+            self.errors = 0
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "durations": {kind: list(values) for kind, values in self.durations.items()},
+                "bytes_sent": self.bytes_sent,
+                "errors": self.errors,
+            }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=b"", content_type="application/xml", headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+        return len(body)
+
+    def _throttled(self):
+        body = (
+            '<?xml version="1.0" encoding="UTF-8"?><Error><Code>SlowDown</Code>'
+            "<Message>Please reduce your request rate.</Message></Error>"
+        ).encode("utf-8")
+        return self._send(503, body, headers={"Retry-After": "0"})
+
+
+class _S3Handler(_Handler):
+    def do_GET(self):
+        started = time.monotonic()
+        kind = "s3_get"
+        sent = 0
+        error = self.server.faults.inject()
+        try:
+            if error:
+                sent = self._throttled()
+                return
+            url = urlsplit(self.path)
+            path = unquote(url.path).lstrip("/")
+            if self.headers.get("Host", "").startswith(f"{self.server.bucket}."):
+                bucket, key = self.server.bucket, path
+            else:
+                bucket, _, key = path.partition("/")
+            query = parse_qs(url.query)
+            if bucket != self.server.bucket:
+                sent = self._error(404, "NoSuchBucket")
+            elif not key and "list-type" in query:
+                kind = "s3_list"
+                sent = self._list(query)
+            else:
+                sent = self._get(key)
+        finally:
+            self.server.log.record(kind, time.monotonic() - started, sent, error)
+
+    do_HEAD = do_GET
+
+    def _error(self, status, code):
+        body = f'<?xml version="1.0" encoding="UTF-8"?><Error><Code>{code}</Code></Error>'.encode("utf-8")
+        return self._send(status, body)
+
+    def _list(self, query):
+        catalogue = self.server.catalogue
+        prefix = query.get("prefix", [""])[0]
+        token = query.get("continuation-token", [""])[0]
+        limit = min(int(query.get("max-keys", [MAX_KEYS])[0]), MAX_KEYS)
+        keys, truncated = catalogue.list_keys(prefix, token, limit)
+        contents = "".join(
+            f"<Contents><Key>{escape(key)}</Key><LastModified>2024-01-01T00:00:00.000Z</LastModified>"
+            f"<ETag>&quot;{catalogue.etag(key)}&quot;</ETag><Size>{catalogue.objects[key]}</Size>"
+            "<StorageClass>STANDARD</StorageClass></Contents>"
+            for key in keys
+        )
+        continuation = f"<NextContinuationToken>{escape(keys[-1])}</NextContinuationToken>" if truncated else ""
+        body = (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<ListBucketResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/">'
+            f"<Name>{self.server.bucket}</Name><Prefix>{escape(prefix)}</Prefix><KeyCount>{len(keys)}</KeyCount>"
+            f"<MaxKeys>{limit}</MaxKeys><IsTruncated>{'true' if truncated else 'false'}</IsTruncated>"
+            f"{continuation}{contents}</ListBucketResult>"
+        ).encode("utf-8")
+        return self._send(200, body)
+
+    def _get(self, key):
+        catalogue = self.server.catalogue
+        if key not in catalogue.objects:
+            return self._error(404, "NoSuchKey")
+        size = catalogue.objects[key]
+        etag = f'"{catalogue.etag(key)}"'
+        if_match = self.headers.get("If-Match")
+        if if_match and if_match != etag:
+            return self._error(412, "PreconditionFailed")
+
+        start, end, status = 0, size, 200
+        headers = {"ETag": etag, "Last-Modified": LAST_MODIFIED, "Accept-Ranges": "bytes"}
+        match = re.fullmatch(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        if match:
+            start = int(match[1])
+            end = min(int(match[2]) + 1, size) if match[2] else size
+            status = 206
+            headers["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(end - start))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command == "HEAD":
+            return 0
+        sent = 0
+        buffer = bytearray()
+        for block in catalogue.content(key, start, end):
+            buffer += block
+            if len(buffer) >= WRITE_BUFFER:
+                self.wfile.write(buffer)
+                sent += len(buffer)
+                buffer = bytearray()
+        self.wfile.write(buffer)
+        return sent + len(buffer)
+
+
+class _CatalogueHandler(_Handler):
+    def do_GET(self):
+        started = time.monotonic()
+        sent = 0
+        error = self.server.faults.inject()
+        try:
+            if error:
+                sent = self._throttled()
+                return
+            sent = self._search(parse_qs(urlsplit(self.path).query))
+        finally:
+            self.server.log.record("search", time.monotonic() - started, sent, error)
+
+    def _search(self, query):
+        filter_query = query.get("$filter", [""])[0]
+        top = int(query.get("$top", [20])[0])
+        skip = int(query.get("$skip", [0])[0])
+
+        def bound(pattern):
+            match = re.search(pattern, filter_query)
+            return match[1] if match else None
+
+        products = self.server.catalogue.search(
+            start=bound(r"ContentDate/Start gt (\S+)"),
+            end=bound(r"ContentDate/Start lt (\S+)"),
+            published_after=bound(r"PublicationDate gt (\S+)"),
+        )
+        expand = query.get("$expand", [""])[0] == "Attributes"
+        page = [
+            product if expand else {name: value for name, value in product.items() if name != "Attributes"}
+            for product in products[skip : skip + top]
+        ]
+        content = {"value": page}
+        if skip + top < len(products):
+            parameters = {name: values[0] for name, values in query.items()}
+            parameters["$skip"] = skip + top
+            content["@odata.nextLink"] = f"{self.server.url}?{urlencode(parameters)}"
+        return self._send(200, json.dumps(content).encode("utf-8"), content_type="application/json")
+
+
+class StubServer(ThreadingHTTPServer):
+    """HTTP-заглушка на localhost в фоновом потоке; адрес — url."""
+
+    daemon_threads = True
+    handler = None
+    path = ""
+
+    def __init__(self, catalogue, faults=None, log=None):
+        super().__init__(("127.0.0.1", 0), self.handler)
+        self.catalogue = catalogue
+        self.faults = faults or Faults()
+        self.log = log or RequestLog()
+        self.url = f"http://127.0.0.1:{self.server_address[1]}{self.path}"
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+
+
+class S3StubServer(StubServer):
+    """
+    Заглушка S3 для бакета bucket: ListObjectsV2 (с продолжением), GetObject и HeadObject
+    с Range и If-Match. Подпись запросов не проверяется.
+    """
+
+    handler = _S3Handler
+    bucket = "eodata"
+
+
+class CatalogueStubServer(StubServer):
+    """Заглушка каталога OData CDSE: фильтр по датам съёмки и публикации, $top/$skip, nextLink."""
+
+    handler = _CatalogueHandler
+    path = "/odata/v1/Products"
@@ -0,0 +1,147 @@
+import bisect
+import hashlib
+import random
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+PATTERN_SIZE = 64 * 1024
+
+# Файлы синтетического продукта L2A относительно папки .SAFE (без manifest.safe)
+PRODUCT_FILES = (
+    "MTD_MSIL2A.xml",
+    "GRANULE/{granule}/IMG_DATA/R10m/T{tile}_{sensing}_B02_10m.jp2",
+    "GRANULE/{granule}/IMG_DATA/R10m/T{tile}_{sensing}_B03_10m.jp2",
+    "GRANULE/{granule}/IMG_DATA/R10m/T{tile}_{sensing}_B04_10m.jp2",
+    "GRANULE/{granule}/IMG_DATA/R10m/T{tile}_{sensing}_B08_10m.jp2",
+    "GRANULE/{granule}/IMG_DATA/R20m/T{tile}_{sensing}_B05_20m.jp2",
+    "GRANULE/{granule}/IMG_DATA/R20m/T{tile}_{sensing}_B11_20m.jp2",
+    "GRANULE/{granule}/IMG_DATA/R20m/T{tile}_{sensing}_SCL_20m.jp2",
+    "GRANULE/{granule}/IMG_DATA/R60m/T{tile}_{sensing}_B01_60m.jp2",
+    "GRANULE/{granule}/QI_DATA/MSK_CLDPRB_20m.jp2",
+    "GRANULE/{granule}/MTD_TL.xml",
+)
+
+
+def _time(moment):
+    return moment.strftime("%Y-%m-%dT%H:%M:%S.%f") + "Z"
+
+
+class SyntheticCatalogue:
+    """
+    Воспроизводимый набор синтетических продуктов Sentinel-2 L2A для заглушек каталога и S3.
+
+    products продуктов равномерно распределены по тайлам tiles и интервалу дат
+    [start, end). У каждого продукта objects_per_product объектов размером около
+    object_size байт и manifest.safe с их контрольными суммами MD5. Содержимое объектов
+    не хранится, а вычисляется из ключа, поэтому набор почти не занимает памяти.
+    """
+
+    def __init__(self, tiles, products, start, end, objects_per_product=8, object_size=128 * 1024, seed=0):
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.products = []
+        self.objects = {}
+        self.manifests = {}
+        self._etags = {}
+
+        step = (end - start) / max(products, 1)
+        for number in range(products):
+            tile = tiles[number % len(tiles)]
+            sensing = start + step * number + timedelta(seconds=self.random.randrange(3600))
+            self._add_product(tile, sensing, number, objects_per_product, object_size)
+        self.products.sort(key=lambda product: product["ContentDate"]["Start"])
+        self.keys = sorted(self.objects)
+
+    def _add_product(self, tile, sensing, number, objects_per_product, object_size):
+        stamp = sensing.strftime("%Y%m%dT%H%M%S")
+        name = f"S2A_MSIL2A_{stamp}_N0510_R{number % 143 + 1:03d}_T{tile}_{stamp}.SAFE"
+        s3path = f"Sentinel-2/MSI/L2A/{sensing:%Y/%m/%d}/{name}"
+        granule = f"L2A_T{tile}_A{number:06d}_{stamp}"
+
+        files = []
+        for template in PRODUCT_FILES[:objects_per_product]:
+            key = f"{s3path}/{template.format(granule=granule, tile=tile, sensing=stamp)}"
+            size = max(1, int(object_size * self.random.uniform(0.5, 1.5)))
+            self.objects[key] = size
+            files.append(key)
+        manifest_key = f"{s3path}/manifest.safe"
+        self.manifests[manifest_key] = self._manifest(s3path, files)
+        self.objects[manifest_key] = len(self.manifests[manifest_key])
+
+        self.products.append(
+            {
+                "Id": str(uuid.UUID(int=self.random.getrandbits(128))),
+                "Name": name,
+                "S3Path": f"/eodata/{s3path}",
+                "ContentDate": {"Start": _time(sensing), "End": _time(sensing + timedelta(seconds=5))},
+                "PublicationDate": _time(sensing + timedelta(hours=3)),
+                "Attributes": [{"Name": "cloudCover", "Value": round(self.random.uniform(0, 100), 2)}],
+            }
+        )
+
+    def _manifest(self, s3path, files):
+        streams = "".join(
+            f'<dataObject ID="{index}"><byteStream mimeType="application/octet-stream" size="{self.objects[key]}">'
+            f'<fileLocation locatorType="URL" href="./{key[len(s3path) + 1:]}"/>'
+            f'<checksum checksumName="MD5">{self.etag(key)}</checksum></byteStream></dataObject>'
+            for index, key in enumerate(files)
+        )
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?><xfdu:XFDU xmlns:xfdu="urn:ccsds:schema:xfdu:1">'
+            f"<dataObjectSection>{streams}</dataObjectSection></xfdu:XFDU>"
+        ).encode("utf-8")
+
+    def list_keys(self, prefix, start_after="", limit=1000):
+        """Ключи с префиксом prefix после start_after (в порядке сортировки) и признак продолжения."""
+        position = bisect.bisect_right(self.keys, start_after) if start_after else bisect.bisect_left(self.keys, prefix)
+        keys = []
+        while position < len(self.keys) and self.keys[position].startswith(prefix):
+            if len(keys) == limit:
+                return keys, True
+            keys.append(self.keys[position])
+            position += 1
+        return keys, False
+
+    def content(self, key, start=0, end=None):
+        """Байты объекта key в диапазоне [start, end) блоками до PATTERN_SIZE."""
+        if key in self.manifests:
+            yield self.manifests[key][start:end]
+            return
+        size = self.objects[key]
+        end = size if end is None else min(end, size)
+        pattern = (hashlib.sha256(key.encode("utf-8")).digest() * (PATTERN_SIZE // 32 + 1))[:PATTERN_SIZE]
+        position = start
+        while position < end:
+            offset = position % PATTERN_SIZE
+            block = pattern[offset : offset + min(PATTERN_SIZE - offset, end - position)]
+            yield block
+            position += len(block)
+
+    def etag(self, key):
+        """MD5 содержимого объекта (ETag однократной загрузки), вычисляемый один раз."""
+        with self.lock:
+            etag = self._etags.get(key)
+        if etag is None:
+            digest = hashlib.md5()
+            for block in self.content(key):
+                digest.update(block)
+            etag = digest.hexdigest()
+            with self.lock:
+                self._etags[key] = etag
+        return etag
+
+    def search(self, start=None, end=None, published_after=None):
+        """Продукты с датой съёмки в интервале (start, end), опубликованные позже published_after."""
+        return [
+            product
+            for product in self.products
+            if (start is None or product["ContentDate"]["Start"] > start)
+            and (end is None or product["ContentDate"]["Start"] < end)
+            and (published_after is None or product["PublicationDate"] > published_after)
+        ]
+
+
+def default_range(days=365):
+    end = datetime(2024, 1, 1)
+    return end - timedelta(days=days), end
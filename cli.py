@@ -0,0 +1,269 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import geopandas as gpd
+
+from api.catalogue import build_footprints
+from api.dataspace_api import MAX_WORKERS, download_sentinel_images
+from api.grid import get_grid
+from api.instrumentation import RunStats, log_stages
+from api.profiling import Profiler
+from api.reporting import JsonLinesReporter
+from api.selection import ObjectSelection
+from api.watch import WATCH_INTERVAL, WATCH_JITTER, WatchTarget, Watcher
+
+DEFAULT_JOB = {
+    "setillite": "SENTINEL-2",
+    "producttype": "S2MSI2A",
+    "cloud_percentage": 100,
+    "aoi_cloud_percentage": None,
+    "product_policy": None,
+    "bands": None,
+    "resolutions": None,
+    "masks": True,
+    "metadata": True,
+    # Порядок загрузки ("size", "tiles" — по плану всех продуктов; null — потоково, в порядке поиска)
+    "order": None,
+    "check_space": True,
+    # Ограничение скорости загрузки задания, МБ/с
+    "bandwidth": None,
+}
+REQUIRED_KEYS = ("aoi", "date_start", "date_end", "target_directory")
+# В режиме наблюдения конец периода не задаётся: новые снимки ищутся до момента опроса
+WATCH_REQUIRED_KEYS = ("aoi", "date_start", "target_directory")
+# Как часто файл метрик перезаписывается в режиме наблюдения, с
+METRICS_INTERVAL = 60
+
+
+def load_jobs(path, required_keys=REQUIRED_KEYS):
+    """
+    Прочитать файл заданий.
+
+    Файл содержит список заданий или объект {"defaults": {...}, "jobs": [...]}; параметры
+    каждого задания дополняются значениями из DEFAULT_JOB и defaults файла.
+    """
+    with open(path, encoding="utf-8") as file:
+        content = json.load(file)
+    if isinstance(content, list):
+        content = {"jobs": content}
+
+    jobs = []
+    for number, job in enumerate(content.get("jobs", []), start=1):
+        job = {**DEFAULT_JOB, **content.get("defaults", {}), **job}
+        missing = [key for key in required_keys if not job.get(key)]
+        if missing:
+            raise ValueError(f"В задании {number} не заданы параметры: {', '.join(missing)}")
+        job.setdefault("name", os.path.splitext(os.path.basename(job["aoi"]))[0])
+        jobs.append(job)
+    return jobs
+
+
+def prepare_job(job):
+    """Прочитать область интересов задания, составить параметры запроса и фильтр объектов."""
+    shapefile = gpd.read_file(job["aoi"])
+    if shapefile.crs is not None and shapefile.crs.to_epsg() != 4326:
+        shapefile = shapefile.to_crs("epsg:4326")
+
+    query_parameters = {
+        "setillite": job["setillite"],
+        "producttype": job["producttype"],
+        "cloud_percentage": job["cloud_percentage"],
+        "footprint": build_footprints(shapefile.geometry.unary_union),
+        "date_start": job["date_start"],
+        "date_end": job.get("date_end"),
+    }
+    selection = ObjectSelection(
+        bands=job["bands"], resolutions=job["resolutions"], masks=job["masks"], metadata=job["metadata"]
+    )
+    os.makedirs(job["target_directory"], exist_ok=True)
+    return shapefile, query_parameters, selection
+
+
+def run_job(
+    job, access_key, secret_key, results, results_lock, download_slots, max_workers, verify=True, stats=None
+):
+    """Поиск и загрузка продуктов одного задания."""
+    shapefile, query_parameters, selection = prepare_job(job)
+
+    return download_sentinel_images(
+        access_key,
+        secret_key,
+        query_parameters,
+        get_grid(),
+        shapefile,
+        job["target_directory"],
+        JsonLinesReporter(results, job=job["name"], lock=results_lock),
+        max_workers=max_workers,
+        selection=selection,
+        aoi_cloud_percentage=job["aoi_cloud_percentage"],
+        product_policy=job["product_policy"],
+        download_slots=download_slots,
+        verify=verify,
+        stats=stats,
+        order=job["order"],
+        check_space=job["check_space"],
+        bandwidth=job["bandwidth"] * 1024 * 1024 if job["bandwidth"] else None,
+    )
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Загрузка снимков Sentinel-2 без графического интерфейса.")
+    parser.add_argument("job_file", help="JSON-файл со списком заданий")
+    parser.add_argument("--access-key", default=os.environ.get("CDSE_ACCESS_KEY"), help="S3 Access Key CDSE")
+    parser.add_argument("--secret-key", default=os.environ.get("CDSE_SECRET_KEY"), help="S3 Secret Key CDSE")
+    parser.add_argument("--jobs", type=int, default=2, help="число одновременно выполняемых заданий")
+    parser.add_argument(
+        "--max-downloads",
+        type=int,
+        default=MAX_WORKERS,
+        help="общее для всех заданий ограничение одновременных загрузок объектов",
+    )
+    parser.add_argument("--results", help="файл результатов (JSON lines), по умолчанию стандартный вывод")
+    parser.add_argument(
+        "--no-verify", action="store_true", help="не проверять загруженные объекты по manifest.safe и ETag"
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="непрерывно опрашивать каталог и загружать только новые продукты областей заданий",
+    )
+    parser.add_argument("--interval", type=float, default=WATCH_INTERVAL, help="интервал опроса в режиме --watch, с")
+    parser.add_argument(
+        "--jitter", type=float, default=WATCH_JITTER, help="случайное отклонение интервала опроса, доля интервала"
+    )
+    parser.add_argument("--report", help="JSON-файл отчёта о запуске: время стадий, счётчики, повторы запросов")
+    parser.add_argument("--metrics", help="файл метрик запуска в текстовом формате Prometheus")
+    parser.add_argument("--profile", help="файл профиля всего запуска")
+    parser.add_argument(
+        "--profile-mode",
+        choices=("sampling", "cprofile"),
+        default="sampling",
+        help="sampling — выборки стеков всех потоков (свёрнутые стеки), "
+        "cprofile — статистика pstats (потоки загрузки видны только в Python 3.12+)",
+    )
+    return parser.parse_args(argv)
+
+
+def write_stats(stats, arguments, **details):
+    """Записать отчёт о запуске и файл метрик, если они заданы в командной строке."""
+    if arguments.report:
+        stats.write_report(arguments.report, **details)
+    if arguments.metrics:
+        stats.write_prometheus(arguments.metrics)
+
+
+def watch(jobs, arguments, results, results_lock, download_slots, stats):
+    """Опрашивать каталог для областей всех заданий до прерывания."""
+    targets = []
+    for job in jobs:
+        shapefile, query_parameters, selection = prepare_job(job)
+        targets.append(
+            WatchTarget(
+                job["name"],
+                query_parameters,
+                shapefile,
+                job["target_directory"],
+                selection=selection,
+                product_policy=job["product_policy"],
+                aoi_cloud_percentage=job["aoi_cloud_percentage"],
+                reporter=JsonLinesReporter(results, job=job["name"], lock=results_lock),
+            )
+        )
+
+    watcher = Watcher(
+        arguments.access_key,
+        arguments.secret_key,
+        get_grid(),
+        targets,
+        interval=arguments.interval,
+        jitter=arguments.jitter,
+        workers=arguments.jobs,
+        max_workers=arguments.max_downloads,
+        download_slots=download_slots,
+        verify=not arguments.no_verify,
+        stats=stats,
+    )
+    thread = threading.Thread(target=watcher.run, daemon=True)
+    thread.start()
+    written = time.monotonic()
+    try:
+        while thread.is_alive():
+            thread.join(1)
+            if time.monotonic() - written >= METRICS_INTERVAL:
+                write_stats(stats, arguments, mode="watch")
+                written = time.monotonic()
+    except KeyboardInterrupt:
+        print("Остановка наблюдения...")
+        watcher.close()
+        thread.join()
+
+
+def main(argv=None):
+    arguments = parse_arguments(argv)
+    if not arguments.access_key or not arguments.secret_key:
+        print("Задайте --access-key и --secret-key или CDSE_ACCESS_KEY и CDSE_SECRET_KEY", file=sys.stderr)
+        return 2
+
+    jobs = load_jobs(arguments.job_file, WATCH_REQUIRED_KEYS if arguments.watch else REQUIRED_KEYS)
+    results = open(arguments.results, "a", encoding="utf-8") if arguments.results else sys.stdout
+    # Сообщения о ходе загрузки идут в stderr, чтобы не смешиваться с результатами
+    if results is sys.stdout:
+        sys.stdout = sys.stderr
+    results_lock = threading.Lock()
+    download_slots = threading.BoundedSemaphore(arguments.max_downloads)
+    stats = RunStats()
+    profiler = Profiler(arguments.profile, arguments.profile_mode) if arguments.profile else None
+
+    failed = 0
+    try:
+        if profiler is not None:
+            profiler.start()
+        if arguments.watch:
+            watch(jobs, arguments, results, results_lock, download_slots, stats)
+            return 0
+        with ThreadPoolExecutor(max_workers=arguments.jobs, thread_name_prefix="job") as executor:
+            futures = {
+                executor.submit(
+                    run_job,
+                    job,
+                    arguments.access_key,
+                    arguments.secret_key,
+                    results,
+                    results_lock,
+                    download_slots,
+                    arguments.max_downloads,
+                    not arguments.no_verify,
+                    stats,
+                ): job
+                for job in jobs
+            }
+            for future in as_completed(futures):
+                job = futures[future]
+                try:
+                    future.result()
+                    print(f"Задание {job['name']} выполнено")
+                except Exception as e:
+                    failed += 1
+                    print(f"Ошибка задания {job['name']}: {e}", file=sys.stderr)
+    finally:
+        if profiler is not None:
+            profiler.stop()
+        log_stages(stats)
+        write_stats(stats, arguments, mode="watch" if arguments.watch else "jobs", jobs=len(jobs), failed_jobs=failed)
+        if arguments.results:
+            results.close()
+        sys.stdout = sys.__stdout__
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    # Необходимо для пула процессов при проверке облачности над областью интересов
+    multiprocessing.freeze_support()
+    sys.exit(main())
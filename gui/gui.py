@@ -5,18 +5,40 @@ import tkinter as tk
 from tkinter import filedialog, messagebox
 
 import customtkinter as ctk
-import geopandas as gpd
 import tkcalendar as tkc
-from shapely.geometry import box
 
-from api.dataspace_api import download_sentinel_images
-from gui.gui_utils import ConsoleRedirect
+from api.selection import RESOLUTIONS, ObjectSelection
+from gui.gui_utils import ConsoleRedirect, ConsoleView, EventBus, GuiReporter
+
+# Задержка перед фоновой загрузкой модулей, чтобы окно успело отрисоваться, мс
+WARM_UP_DELAY = 200
+
+
+def warm_up():
+    """
+    Импорт геопространственных модулей, модулей AWS и каталога и загрузка сетки тайлов.
+
+    Их импорт занимает секунды, поэтому окно их не ждёт: они загружаются в фоновом потоке
+    после его появления и готовы к тому времени, когда пользователь начнёт загрузку.
+    """
+    try:
+        import geopandas  # noqa: F401
+
+        import api.dataspace_api  # noqa: F401
+        from api.grid import get_grid
+
+        get_grid()
+    except Exception:
+        # Та же ошибка повторится и будет показана пользователю при начале загрузки
+        pass
 
 
 class MainGUI:
     def __init__(self, root):
         self.root = root
+        self.events = EventBus(root)
         self.create_widgets()
+        self.root.after(WARM_UP_DELAY, lambda: threading.Thread(target=warm_up, daemon=True).start())
 
     def create_widgets(self):
         # Title label
@@ -40,13 +62,16 @@ class MainGUI:
         self.slider_entry_frame = SliderEntryFrame(self.frame)
         self.slider_entry_frame.pack(pady=5, padx=5)
 
+        self.selection_frame = SelectionFrame(self.frame)
+        self.selection_frame.pack(pady=5, padx=5)
+
         self.path_download_frame = PathDownloadFrame(self.frame, self.directory)
         self.path_download_frame.pack(pady=5, padx=5)
 
         self.button_download = ctk.CTkButton(
             master=self.frame,
             text="Скачать",
-            command=lambda: threading.Thread(target=self.button_callback, daemon=True).start(),
+            command=self.start_download,
             font=("Roboto", 14),
         )
         self.button_download.pack(pady=10, padx=10)
@@ -84,15 +109,25 @@ class MainGUI:
     def directory(self):
         self.path_download_frame.directory()
 
-    def button_callback(self):
-        console = ConsoleRedirect()
-
+    def start_download(self):
+        """Создать консоль в главном потоке и запустить загрузку в рабочем потоке."""
         text = ctk.CTkTextbox(master=self.frame, width=900, height=200)
         text.pack(pady=5, padx=10, fill=tk.NONE, expand=False)
 
         text.configure(font=("serif", 13), spacing1=10)
-        console.RedirectTextBox(text)
-        sys.stdout = console
+        ConsoleView(text, self.events)
+        sys.stdout = ConsoleRedirect(self.events)
+        threading.Thread(target=self.button_callback, daemon=True).start()
+
+    def show_error(self, message):
+        """Показать окно с ошибкой из рабочего потока."""
+        self.events.call(messagebox.showerror, "Ошибка", message)
+
+    def button_callback(self):
+        # Импорт здесь, а не в начале модуля, ускоряет запуск; обычно warm_up уже загрузил эти модули
+        from api.catalogue import build_footprints
+        from api.dataspace_api import download_sentinel_images
+        from api.grid import get_grid
 
         platform = "SENTINEL-2"
         level = "S2MSI2A"
@@ -101,45 +136,53 @@ class MainGUI:
         s3_secret_key = self.login_frame.get_secret_key()
 
         if not s3_access_key or not s3_secret_key:
-            messagebox.showerror("Ошибка", "Введите Access Key и Secret Key")
+            self.show_error("Введите Access Key и Secret Key")
             return
 
         try:
             date_first = str(self.deadline_entry.calendar_first.get_date().strftime("%Y-%m-%d"))
             date_second = str(self.deadline_entry.calendar_second.get_date().strftime("%Y-%m-%d"))
             if date_first > date_second:
-                messagebox.showerror("Ошибка", "Начальная дата не может быть позже конечной даты")
+                self.show_error("Начальная дата не может быть позже конечной даты")
                 return
         except Exception as e:
-            messagebox.showerror("Ошибка", f"Ошибка при получении дат: {str(e)}")
+            self.show_error(f"Ошибка при получении дат: {str(e)}")
             return
 
         try:
             cloud_percent = self.slider_entry_frame.progress
+            aoi_cloud_percent = None
+            if self.slider_entry_frame.aoi_var.get():
+                # Облачность сцены не ограничивается: отбор выполняется по облачности над областью интересов
+                aoi_cloud_percent, cloud_percent = cloud_percent, 100
         except Exception as e:
-            messagebox.showerror("Ошибка", f"Ошибка при получении процента облачности: {str(e)}")
+            self.show_error(f"Ошибка при получении процента облачности: {str(e)}")
             return
 
         try:
             shapefile = self.shpfile_entry.get_shapefile()
-            bounds = shapefile.total_bounds
-            footprint = box(bounds[0], bounds[1], bounds[2], bounds[3]).wkt
+            footprint = build_footprints(shapefile.geometry.unary_union)
         except Exception as e:
-            messagebox.showerror("Ошибка", f"Ошибка при обработке файла формы: {str(e)}")
+            self.show_error(f"Ошибка при обработке файла формы: {str(e)}")
+            return
+
+        try:
+            selection = self.selection_frame.get_selection()
+            product_policy = self.selection_frame.get_product_policy()
+        except Exception as e:
+            self.show_error(f"Ошибка при выборе каналов: {str(e)}")
             return
 
         try:
             dir_download = self.path_download_frame.get_selected_directory()
         except Exception as e:
-            messagebox.showerror("Ошибка", f"Ошибка при получении директории: {str(e)}")
+            self.show_error(f"Ошибка при получении директории: {str(e)}")
             return
 
         try:
-            grid = gpd.read_file(
-                os.path.join(os.path.dirname(__file__), "sentinel2_grid", "sentinel_2_index_shapefile.shp")
-            )
+            grid = get_grid()
         except Exception as e:
-            messagebox.showerror("Ошибка", f"Ошибка при чтении файла сетки: {str(e)}")
+            self.show_error(f"Ошибка при чтении файла сетки: {str(e)}")
             return
 
         query_parameters = {
@@ -153,11 +196,20 @@ class MainGUI:
 
         try:
             download_sentinel_images(
-                s3_access_key, s3_secret_key, query_parameters, grid, shapefile, dir_download, self.frame
+                s3_access_key,
+                s3_secret_key,
+                query_parameters,
+                grid,
+                shapefile,
+                dir_download,
+                GuiReporter(self.frame, self.events),
+                selection=selection,
+                aoi_cloud_percentage=aoi_cloud_percent,
+                product_policy=product_policy,
             )
             print("Все спутниковые снимки Sentinel-2 загружены!")
         except Exception as e:
-            messagebox.showerror("Ошибка", f"Ошибка при загрузке снимков: {str(e)}")
+            self.show_error(f"Ошибка при загрузке снимков: {str(e)}")
         finally:
             sys.stdout = ConsoleRedirect()
             sys.stderr = ConsoleRedirect()
@@ -264,6 +316,12 @@ class SliderEntryFrame(ctk.CTkFrame):
         self.entry.grid(row=1, column=1, padx=5, pady=2)
         self.entry.bind("<Return>", lambda event: self.entry_callback())
 
+        self.aoi_var = tk.BooleanVar(value=False)
+        self.aoi_checkbox = ctk.CTkCheckBox(
+            master=self, text="Облачность над областью интересов", variable=self.aoi_var, font=("Roboto", 13)
+        )
+        self.aoi_checkbox.grid(row=2, column=0, columnspan=2, padx=10, pady=2)
+
     def slider_callback(self, value):
         self.progress = round(float(value) * 100)
         self.progressbar_label.configure(text=f"Процент облачности: {self.progress} %")
@@ -282,6 +340,64 @@ class SliderEntryFrame(ctk.CTkFrame):
             pass  # Обработка процента облачности
 
 
+PRODUCT_POLICIES = {
+    "последняя версия": "baseline",
+    "мин. облачность": "cloud",
+    "макс. покрытие": "coverage",
+    "все продукты": None,
+}
+
+
+class SelectionFrame(ctk.CTkFrame):
+    def __init__(self, master):
+        super().__init__(master)
+
+        self.label_bands = ctk.CTkLabel(master=self, text="Каналы (все, если пусто):", font=("Roboto", 15))
+        self.label_bands.grid(row=0, column=0, padx=10, pady=2)
+
+        self.entry_bands = ctk.CTkEntry(master=self, placeholder_text="B02, B03, B04, SCL", font=("Roboto", 13))
+        self.entry_bands.grid(row=0, column=1, columnspan=2, padx=10, pady=2, sticky="ew")
+
+        self.resolution_vars = {}
+        for column, resolution in enumerate(RESOLUTIONS):
+            variable = tk.BooleanVar(value=True)
+            checkbox = ctk.CTkCheckBox(master=self, text=resolution, variable=variable, font=("Roboto", 13))
+            checkbox.grid(row=1, column=column, padx=10, pady=2)
+            self.resolution_vars[resolution] = variable
+
+        self.masks_var = tk.BooleanVar(value=True)
+        self.masks_checkbox = ctk.CTkCheckBox(master=self, text="Маски", variable=self.masks_var, font=("Roboto", 13))
+        self.masks_checkbox.grid(row=2, column=0, padx=10, pady=2)
+
+        self.metadata_var = tk.BooleanVar(value=True)
+        self.metadata_checkbox = ctk.CTkCheckBox(
+            master=self, text="Метаданные", variable=self.metadata_var, font=("Roboto", 13)
+        )
+        self.metadata_checkbox.grid(row=2, column=1, padx=10, pady=2)
+
+        self.label_policy = ctk.CTkLabel(master=self, text="Продукт на тайл и дату:", font=("Roboto", 15))
+        self.label_policy.grid(row=3, column=0, padx=10, pady=2)
+
+        self.policy_menu = ctk.CTkOptionMenu(master=self, values=list(PRODUCT_POLICIES), font=("Roboto", 13))
+        self.policy_menu.set("последняя версия")
+        self.policy_menu.grid(row=3, column=1, columnspan=2, padx=10, pady=2)
+
+    def get_selection(self):
+        bands = [band.strip() for band in self.entry_bands.get().replace(";", ",").split(",") if band.strip()]
+        resolutions = [resolution for resolution, variable in self.resolution_vars.items() if variable.get()]
+        if not resolutions:
+            raise ValueError("Не выбрано ни одного разрешения.")
+        return ObjectSelection(
+            bands=bands or None,
+            resolutions=resolutions,
+            masks=self.masks_var.get(),
+            metadata=self.metadata_var.get(),
+        )
+
+    def get_product_policy(self):
+        return PRODUCT_POLICIES[self.policy_menu.get()]
+
+
 class ShapefileEntryFrame(ctk.CTkTabview):
     def __init__(self, master, open_shapefile, open_geojsonfile):
         super().__init__(master, height=30)
@@ -322,6 +438,8 @@ class ShapefileEntryFrame(ctk.CTkTabview):
         self.entry_find_geojson.grid(row=0, column=1, padx=10, pady=10)
 
     def open_shapefile(self):
+        import geopandas as gpd
+
         file_path = filedialog.askopenfilename(filetypes=[("Shapefile", "*.shp")])
         if file_path:
             shp_file = gpd.read_file(file_path)
@@ -332,6 +450,8 @@ class ShapefileEntryFrame(ctk.CTkTabview):
             self.entry_find_shp.configure(text=os.path.basename(file_path))
 
     def open_geojsonfile(self):
+        import geopandas as gpd
+
         file_path = filedialog.askopenfilename(filetypes=[("GeoJSON", "*.geojson")])
         if file_path:
             geojson_file = gpd.read_file(file_path)
@@ -1,46 +1,114 @@
-import os
-import time
+import queue
+import sys
 import tkinter as tk
+import traceback
 
 import customtkinter as ctk
 from CTkTable import *
 
+from api.reporting import CLOUDY, DOWNLOADED, DOWNLOADING, FAILED, PRESENT, Reporter
+
+
+DRAIN_INTERVAL = 100
+MAX_EVENTS_PER_DRAIN = 5000
+CONSOLE_LINES = 2000
+
+
+class EventBus:
+    """
+    Thread-safe queue of events from worker threads to the Tk main loop.
+
+    Worker threads only call post(); the main loop drains the queue every interval
+    milliseconds and hands each handler all events of its kind collected since the
+    previous drain, so widgets are touched only from the main thread and in batches.
+    """
+
+    def __init__(self, widget, interval=DRAIN_INTERVAL):
+        self.widget = widget
+        self.interval = interval
+        self.events = queue.SimpleQueue()
+        self.handlers = {}
+        self.widget.after(self.interval, self.drain)
+
+    def subscribe(self, kind, handler):
+        """Register handler(payloads) for events of the given kind."""
+        self.handlers[kind] = handler
+
+    def post(self, kind, payload):
+        self.events.put((kind, payload))
+
+    def call(self, function, *args):
+        """Run function(*args) on the main thread."""
+        self.post("call", (function, args))
+
+    def drain(self):
+        try:
+            batches = {}
+            for _ in range(MAX_EVENTS_PER_DRAIN):
+                try:
+                    kind, payload = self.events.get_nowait()
+                except queue.Empty:
+                    break
+                batches.setdefault(kind, []).append(payload)
+
+            for kind, payloads in batches.items():
+                if kind == "call":
+                    for function, args in payloads:
+                        self._dispatch(function, *args)
+                elif kind in self.handlers:
+                    self._dispatch(self.handlers[kind], payloads)
+        finally:
+            # A failing handler must not stop the timer, or the window stops updating
+            self.widget.after(self.interval, self.drain)
+
+    @staticmethod
+    def _dispatch(function, *args):
+        try:
+            function(*args)
+        except Exception:
+            # The console output may itself be routed through the bus, so report to the real stderr
+            traceback.print_exc(file=sys.__stderr__)
+
 
 class ConsoleRedirect:
-    """Redirect console output to a tkinter text box."""
+    """Redirect console output to the event bus; without a bus the output is discarded."""
 
-    def __init__(self):
+    def __init__(self, bus=None):
         """Initialize ConsoleRedirect."""
-        self.textBox = None
-
-    def RedirectTextBox(self, textBox):
-        """Redirect console output to the specified text box."""
-        self.textBox = textBox
+        self.bus = bus
 
     def write(self, string):
-        """Write the given string to the text box."""
-        if self.textBox:
-            self.textBox.insert(tk.END, string)
-            self.textBox.update_idletasks()  # force an update of the text widget
-            self.textBox.after(50)
+        """Queue the given string for the console view."""
+        if self.bus is not None and string:
+            self.bus.post("log", string)
+
+    def flush(self):
+        pass
 
 
-def get_folder_size(folder_path):
-    total_size = 0
-    for path, dirs, files in os.walk(folder_path):
-        for file in files:
-            file_path = os.path.join(path, file)
-            total_size += os.path.getsize(file_path)
-    return total_size
+class ConsoleView:
+    """Text box keeping only the last max_lines lines of the console, like a ring buffer."""
+
+    def __init__(self, textbox, bus, max_lines=CONSOLE_LINES):
+        self.textbox = textbox
+        self.max_lines = max_lines
+        bus.subscribe("log", self.append)
+
+    def append(self, strings):
+        self.textbox.insert(tk.END, "".join(strings))
+        lines = int(self.textbox.index("end-1c").split(".")[0])
+        if lines > self.max_lines:
+            self.textbox.delete("1.0", f"{lines - self.max_lines + 1}.0")
+        self.textbox.see(tk.END)
 
 
 class DownloadProgressBar:
-    """Class for displaying a download progress bar."""
+    """Class for displaying a download progress bar fed by a TransferMonitor."""
 
-    def __init__(self, parent_frame, filepath, final_size, update_interval=1):
+    def __init__(self, parent_frame, monitor, product_name, update_interval=1):
         self.parent_frame = parent_frame
-        self.filepath = filepath
-        self.final_size = final_size
+        self.monitor = monitor
+        self.product_name = product_name
         self.update_interval = update_interval
 
         self.progressbar_download = ctk.CTkProgressBar(
@@ -67,36 +135,32 @@ class DownloadProgressBar:
         speed_label = ctk.CTkLabel(self.parent_frame, textvariable=self.speed_text, font=("Helvetica", 14))
         speed_label.grid(row=0, column=3, padx=5, pady=2)
 
-        self.start_time = time.time()
+        self.eta_text = tk.StringVar()
+        eta_label = ctk.CTkLabel(self.parent_frame, textvariable=self.eta_text, font=("Helvetica", 14))
+        eta_label.grid(row=0, column=4, padx=5, pady=2)
+
         self.update_progress()
 
     def update_progress(self):
-        """Update the download progress."""
-        downloaded_size = self.file_size_downloaded(self.filepath)
-        if downloaded_size == self.final_size:
-            self.progress_text.set("Download complete")
+        """Update the download progress from the monitor's in-memory counters."""
+        snapshot = self.monitor.snapshot(self.product_name)
+        if snapshot["state"] != "загрузка":
+            self.progress_text.set("Download complete" if snapshot["state"] == "загружено" else "Download failed")
             self.speed_text.set("")
-            self.progressbar_download.set(1)
+            self.eta_text.set("")
+            self.progressbar_download.set(1 if snapshot["state"] == "загружено" else snapshot["percent"] / 100)
             return
 
-        progress_percent = int((downloaded_size / self.final_size) * 100)
-        self.progressbar_download.set(progress_percent / 100)
-        self.progress_text.set("{}%".format(progress_percent))
-        self.size_text.set("{}MB".format(round((self.final_size / 1024 / 1024))))
-        time_elapsed = time.time() - self.start_time
-        download_speed = downloaded_size / time_elapsed
-        self.speed_text.set("{:.2f} MB/s".format(download_speed / 1024 / 1024))
+        self.progressbar_download.set(snapshot["percent"] / 100)
+        self.progress_text.set("{}%".format(snapshot["percent"]))
+        self.size_text.set("{}MB".format(round((snapshot["size"] / 1024 / 1024))))
+        self.speed_text.set(
+            "{:.2f} MB/s (avg {:.2f})".format(snapshot["speed"] / 1024 / 1024, snapshot["average_speed"] / 1024 / 1024)
+        )
+        self.eta_text.set("" if snapshot["eta"] is None else "ETA {:.0f} s".format(snapshot["eta"]))
 
         self.parent_frame.after(self.update_interval * 1000, self.update_progress)
 
-    def file_size_downloaded(self, filepath):
-        size = 0
-        try:
-            size = get_folder_size(filepath)
-        except FileNotFoundError:
-            pass
-        return size
-
 
 class DownloadBarFrame(ctk.CTkFrame):
     """Class for a frame containing the download bar."""
@@ -111,3 +175,55 @@ class InformationTable(CTkTable):
     def __init__(self, master, data):
         super().__init__(master, values=data, corner_radius=0, hover_color="#329acd")
         self.pack(expand=True, fill="both", padx=20, pady=20)
+
+
+class GuiReporter(Reporter):
+    """
+    Reporter that shows product statuses in an information table and progress bars in a frame.
+
+    Pipeline threads only post events to the bus; the table and the bars are updated on the
+    main thread, and of several statuses of one product queued since the last drain only the
+    latest is applied.
+    """
+
+    STATUS_TEXT = {
+        PRESENT: "в папке",
+        DOWNLOADING: "загрузка...",
+        DOWNLOADED: "загружено!",
+        FAILED: "ошибка загрузки",
+    }
+
+    def __init__(self, master_frame, bus):
+        self.master_frame = master_frame
+        self.bus = bus
+        self.information_table = None
+        self.rows = {}
+        bus.subscribe("status", self.show_statuses)
+        bus.subscribe("progress", self.show_progress)
+
+    def status_text(self, status, details):
+        if status == CLOUDY:
+            return "облачность {:.0f}%".format(details["cloud_percentage"])
+        return self.STATUS_TEXT[status]
+
+    def product_status(self, file_name, status, **details):
+        self.bus.post("status", (file_name, self.status_text(status, details)))
+
+    def product_progress(self, file_name, monitor):
+        self.bus.post("progress", (file_name, monitor))
+
+    def show_statuses(self, statuses):
+        for file_name, text in dict(statuses).items():
+            if file_name in self.rows:
+                self.information_table.insert(self.rows[file_name], 1, text)
+                continue
+            if self.information_table is None:
+                self.information_table = InformationTable(master=self.master_frame, data=[[file_name, text]])
+            else:
+                self.information_table.add_row([file_name, text])
+            self.rows[file_name] = len(self.rows)
+
+    def show_progress(self, products):
+        for file_name, monitor in products:
+            download_barr = DownloadBarFrame(master=self.master_frame)
+            DownloadProgressBar(download_barr.download_barr_frame, monitor, file_name)
@@ -1,3 +1,5 @@
+import multiprocessing
+
 import customtkinter as ctk
 
 from gui.gui import MainGUI
@@ -25,6 +27,8 @@ def set_window_dimensions(window, width_percentage, height_percentage):
 
 
 if __name__ == "__main__":
+    # Необходимо для пула процессов в собранном PyInstaller приложении
+    multiprocessing.freeze_support()
     ctk.set_appearance_mode("dark")  # Modes: "System" (standard), "Dark", "Light"
     ctk.set_default_color_theme("blue")  # Themes: "blue" (standard), "green", "dark-blue"
 
@@ -0,0 +1,38 @@
+"""
+Проверки разбора ошибок запросов общим Retrier.
+
+    python -m unittest discover tests
+"""
+
+import unittest
+
+from botocore.exceptions import ClientError, EndpointConnectionError
+
+from api.retry import _parse_retry_after, classify
+
+
+class ClassifyTest(unittest.TestCase):
+    def test_failed_connect_is_retried(self):
+        # Собственные повторы botocore отключены, поэтому отказ соединения повторяет Retrier
+        error = EndpointConnectionError(endpoint_url="https://eodata.dataspace.copernicus.eu/")
+        self.assertEqual(classify(error), (True, False, None))
+
+    def test_slow_down_is_throttling(self):
+        error = ClientError({"Error": {"Code": "SlowDown"}, "ResponseMetadata": {"HTTPStatusCode": 503}}, "GetObject")
+        self.assertEqual(classify(error), (True, True, None))
+
+    def test_missing_object_is_not_retried(self):
+        error = ClientError({"Error": {"Code": "NoSuchKey"}, "ResponseMetadata": {"HTTPStatusCode": 404}}, "GetObject")
+        self.assertEqual(classify(error), (False, False, None))
+
+
+class RetryAfterTest(unittest.TestCase):
+    def test_invalid_date_is_ignored(self):
+        self.assertIsNone(_parse_retry_after("not a date"))
+
+    def test_seconds(self):
+        self.assertEqual(_parse_retry_after("5"), 5.0)
+
+
+if __name__ == "__main__":
+    unittest.main()